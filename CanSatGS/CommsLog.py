@@ -1,16 +1,31 @@
+import collections
 import os
+import time
 
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
+from LogWriter import LogWriterThread
+from MissionArchive import ArchiveWriter
 
-def file_is_empty(path):
-    return os.stat(path).st_size==0
 
 class CommsLog(QWidget):
 
-    def __init__(self):
+    def __init__(self, flush_bytes=65536, flush_interval=1.0, fsync_interval=5.0, max_lines=250, frame_interval=16,
+                 archive=True):
         super().__init__()
 
+        # Lines for the text pane wait here and are drawn together at most once a frame. Only the last max_lines can
+        # ever be on screen, so that's all that is kept while the pane is hidden.
+        self.max_lines = max_lines
+        self.pending_lines = collections.deque(maxlen=max_lines)
+        self.formats = {}
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(frame_interval)
+        self.render_timer.timeout.connect(self.render_lines)
+
         self.logging_enabled = False
 
         self.raw_file = "defaultRaw.txt"
@@ -18,6 +33,17 @@ class CommsLog(QWidget):
 
         self.csv_headers = "No headers :("
 
+        # Parsed batches also go to a columnar binary archive named after the CSV file, e.g. defaultCSV.gsa
+        self.archive = archive
+
+        # All file output happens on the writer thread so a slow disk can't stall the GUI. It keeps the log files open
+        # while output is enabled and fsyncs them every fsync_interval seconds.
+        self.writer_thread = LogWriterThread(flush_bytes, flush_interval, fsync_interval)
+        self.writer_thread.start()
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(500)
+        self.stats_timer.timeout.connect(self.update_writer_stats)
+
         self.init_ui()
 
 
@@ -30,7 +56,7 @@ class CommsLog(QWidget):
 
         self.textbox = QPlainTextEdit()
         self.textbox.setReadOnly(True)
-        self.textbox.setMaximumBlockCount(250)
+        self.textbox.setMaximumBlockCount(self.max_lines)
         self.textbox.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
         self.raw_btn = QPushButton("Set Log File")
@@ -50,12 +76,15 @@ class CommsLog(QWidget):
         self.csv_box.setReadOnly(True)
         self.csv_box.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Preferred)
 
-        layout.addWidget(self.textbox, 0, 0, 5, 1)
+        self.writer_label = QLabel()
+
+        layout.addWidget(self.textbox, 0, 0, 6, 1)
         layout.addWidget(self.raw_btn, 1, 1)
         layout.addWidget(self.csv_btn, 3, 1)
         layout.addWidget(self.enable_btn, 0, 1)
         layout.addWidget(self.raw_box, 2, 1)
         layout.addWidget(self.csv_box, 4, 1)
+        layout.addWidget(self.writer_label, 5, 1)
 
     def show_raw_file_dialog(self):
         options = QFileDialog.Options()
@@ -86,34 +115,142 @@ class CommsLog(QWidget):
         self.csv_box.setEnabled(not self.logging_enabled)
         if self.logging_enabled:
             self.enable_btn.setText("Disable File Output")
+            self.stats_timer.start()
         else:
             self.enable_btn.setText("Enable File Output")
+            # Anything still queued is written before the files are closed
+            self.writer_thread.close_files()
+
+    def stop_writer(self):
+        self.logging_enabled = False
+        self.stats_timer.stop()
+        self.writer_thread.stop()
+
+    def update_writer_stats(self):
+        stats = self.writer_thread.stats()
+        text = (f"Backlog {stats['backlog']}, write {stats['latency'] * 1000:.1f} ms "
+                f"(max {stats['max_latency'] * 1000:.0f} ms)")
+        if stats["dropped_lines"]:
+            text += f", {stats['dropped_lines']} lines dropped"
+        if not stats["alive"]:
+            text = "Log writer stopped, nothing is being saved. " + text
+
+        last_error = self.writer_thread.last_error
+        failing = last_error is not None and time.perf_counter() - last_error < 5
+        if not stats["alive"] or failing:
+            self.writer_label.setStyleSheet("color: red")
+        else:
+            self.writer_label.setStyleSheet("")
+        if stats["errors"]:
+            text += f", {stats['errors']} errors"
+            self.writer_label.setToolTip(str(self.writer_thread.errors[-1]))
+        self.writer_label.setText(text)
+        if not self.logging_enabled and not stats["backlog"]:
+            self.stats_timer.stop()
+
+    def text_format(self, color):
+        text_format = self.formats.get(color)
+        if text_format is None:
+            text_format = self.formats[color] = QTextCharFormat()
+            text_format.setForeground(QColor(color))
+        return text_format
+
+    def queue_lines(self, texts, color):
+        text_format = self.text_format(color)
+        self.pending_lines.extend((text, text_format) for text in texts)
+        if self.isVisible() and not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def render_lines(self):
+        if not self.pending_lines or not self.isVisible():
+            return
+        scroll_bar = self.textbox.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+
+        document = self.textbox.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        first = document.isEmpty()
+        for text, text_format in self.pending_lines:
+            if not first:
+                cursor.insertBlock()
+            first = False
+            cursor.insertText(text, text_format)
+        cursor.endEditBlock()
+        self.pending_lines.clear()
+
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
 
-    def log_text(self, text, color):
-        self.textbox.appendHtml("<font color="+color+">"+text+"</font>")
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.render_lines()
+
+    def connect_parser(self, parser):
+        # File output is handed to the writer thread straight from the parser thread, so a stalled GUI doesn't hold up
+        # logging. Only the text pane waits for the GUI thread.
+        parser.csv_headers.connect(self.set_headers, Qt.DirectConnection)
+        parser.packet_batch.connect(self.write_packets, Qt.DirectConnection)
+        parser.parsed_batch.connect(self.write_batch, Qt.DirectConnection)
+        parser.malformed.connect(self.write_malformed, Qt.DirectConnection)
+        for signal in (parser.message, parser.command, parser.error, parser.warning):
+            signal.connect(self.write_text, Qt.DirectConnection)
+
+        parser.packet_batch.connect(self.log_packets)
+        parser.message.connect(self.log_message)
+        parser.command.connect(self.log_command)
+        parser.error.connect(self.log_error)
+        parser.warning.connect(self.log_warning)
+        parser.malformed.connect(self.log_malformed)
+
+    # The write_ methods may be called from any thread
+
+    def write_text(self, text):
         if self.logging_enabled and self.raw_file:
-            with open(self.raw_file, "a") as text_file:
-                text_file.write(text+"\n")
+            self.writer_thread.write(self.raw_file, [text])
 
-    def log_packet(self, text):
-        self.log_text(text, "white")
+    def write_packets(self, texts):
+        if self.logging_enabled and self.raw_file:
+            self.writer_thread.write(self.raw_file, texts)
         if self.logging_enabled and self.csv_file:
-            with open(self.csv_file, "a") as text_file:
-                if file_is_empty(self.csv_file):
-                    text_file.write(self.csv_headers+"\n")
-                text_file.write(text+"\n")
+            # Only a new file gets the header, appending to an old log carries on under the header it already has
+            self.writer_thread.write(self.csv_file, texts, self.csv_headers)
+
+    def write_malformed(self, text, reason):
+        # The reason is only shown on screen, the log keeps the line exactly as it was received
+        self.write_text(text)
+
+    def write_batch(self, batch):
+        if self.logging_enabled and self.archive and self.csv_file and not batch.warmup:
+            self.writer_thread.write_batch(self.archive_path(), batch,
+                                           lambda path: ArchiveWriter(path, batch.schema))
+
+    def archive_path(self):
+        return os.path.splitext(self.csv_file)[0] + ".gsa"
+
+    # The log_ methods only add to the text pane and belong on the GUI thread
+
+    def log_packet(self, text):
+        self.log_packets([text])
+
+    def log_packets(self, texts):
+        self.queue_lines(texts, "white")
 
     def log_command(self, text):
-        self.log_text(text, "dodgerblue")
+        self.queue_lines([text], "dodgerblue")
 
     def log_message(self, text):
-        self.log_text(text, "limegreen")
+        self.queue_lines([text], "limegreen")
 
     def log_error(self, text):
-        self.log_text(text, "red")
+        self.queue_lines([text], "red")
 
     def log_warning(self, text):
-        self.log_text(text, "yellow")
+        self.queue_lines([text], "yellow")
+
+    def log_malformed(self, text, reason):
+        self.queue_lines([f"{text} (malformed packet: {reason})"], "yellow")
 
     def set_headers(self, text):
         self.csv_headers = text
@@ -1,5 +1,17 @@
+import time
+from operator import itemgetter
+
+import numpy as np
 from PyQt5.QtCore import *
 
+from LinkStats import LinkStats
+
+# The telemetry packet layout. Exponents scale each raw integer field, "str" fields are kept as text.
+PACKET_NAMES = ["team_id", "mission_time", "packet_count", "altitude", "pressure", "temp", "voltage", "gps_time",
+                "gps_latitude", "gps_longitude", "gps_altitude", "gps_sats", "pitch", "roll", "blade_spin_rate",
+                "software_state", "bonus_direction"]
+PACKET_EXPONENTS = [0, -3, 0, -1, 0, -1, -2, 0, -5, -5, -1, 0, -1, -1, 0, "str", -1]
+
 def is_number(s):
     try:
         float(s)
@@ -7,62 +19,292 @@ def is_number(s):
     except ValueError:
         return False
 
+
+def field_index(schema, key):
+    # Widgets resolve their field names to column indices once when they're built. Without a schema they keep the
+    # name, which TelemetryPacket and TelemetryBatch also accept.
+    return schema.index[key] if schema is not None else key
+
+class FieldError(ValueError):
+
+    def __init__(self, name, value, reason):
+        super().__init__(f"field {name}={value!r} {reason}" if name else reason)
+        self.name = name
+        self.value = value
+        self.reason = reason
+
+
+class TelemetrySchema:
+    """
+    The packet layout compiled once, with a 10**exponent multiplier ready for every numeric field.
+    """
+
+    def __init__(self, names, exponents):
+        assert (len(names) == len(exponents)), "Names and Exponents not same length"
+        self.names = list(names)
+        self.exponents = list(exponents)
+        self.field_count = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        self.multipliers = [10.0**exponent if type(exponent) is int else None for exponent in self.exponents]
+        self.numeric = [(i, multiplier) for i, multiplier in enumerate(self.multipliers) if multiplier is not None]
+        self.strings = [i for i, multiplier in enumerate(self.multipliers) if multiplier is None]
+        self.converters = [float if multiplier is not None else str for multiplier in self.multipliers]
+
+        self.numeric_getter = itemgetter(*[i for i, multiplier in self.numeric])
+        self.numeric_multipliers = np.array([[multiplier] for i, multiplier in self.numeric])
+
+    def convert(self, values):
+        if len(values) != self.field_count:
+            raise FieldError(None, None, f"has {len(values)} fields, expected {self.field_count}")
+        try:
+            for i, multiplier in self.numeric:
+                values[i] = float(values[i]) * multiplier
+        except ValueError:
+            raise self.find_error(values) from None
+        return values
+
+    def find_error(self, values):
+        # Only reached for a bad packet, so it's fine to go back over it field by field
+        for name, converter, value in zip(self.names, self.converters, values):
+            if converter is float and type(value) is str:
+                try:
+                    float(value)
+                except ValueError:
+                    return FieldError(name, value, "is not a number")
+        return FieldError(None, None, "could not be converted")
+
+    def parse_columns(self, lines, times=None):
+        """
+        Parse many packets into one NumPy array per field. Returns the batch and (line, FieldError) for each reject.
+        """
+        rows = [text.split(",") for text in lines]
+        times = np.array(times, dtype=np.float64) if times is not None else np.full(len(lines), time.time())
+        rejects = []
+        if any(len(row) != self.field_count for row in rows):
+            lines, rows, times, rejects = self.split_rejects(lines, rows, times)
+
+        try:
+            table = np.array(list(map(self.numeric_getter, rows)), dtype=np.float64)
+        except ValueError:
+            lines, rows, times, more_rejects = self.split_rejects(lines, rows, times)
+            rejects += more_rejects
+            table = np.array(list(map(self.numeric_getter, rows)), dtype=np.float64)
+
+        # One row per field so every column handed out below is contiguous
+        table = np.multiply(table.reshape(len(rows), len(self.numeric)).T, self.numeric_multipliers, order="C")
+
+        columns = {}
+        for row, (i, multiplier) in enumerate(self.numeric):
+            columns[self.names[i]] = table[row]
+        for i in self.strings:
+            columns[self.names[i]] = np.array([values[i] for values in rows], dtype=object)
+        return TelemetryBatch(self, columns, lines, times), rejects
+
+    def split_rejects(self, lines, rows, times):
+        good_lines = []
+        good_rows = []
+        good = []
+        rejects = []
+        for i, (text, values) in enumerate(zip(lines, rows)):
+            try:
+                self.convert(list(values))
+            except FieldError as e:
+                rejects.append((text, e))
+            else:
+                good_lines.append(text)
+                good_rows.append(values)
+                good.append(i)
+        return good_lines, good_rows, times[good], rejects
+
+
+class TelemetryPacket:
+    """
+    One packet as a tuple of converted values in schema order.
+
+    Indexing by column number is a plain tuple lookup; indexing by field name goes through the schema.
+    """
+
+    __slots__ = ("schema", "values")
+
+    def __init__(self, schema, values):
+        self.schema = schema
+        self.values = values
+
+    def __getitem__(self, key):
+        if type(key) is int:
+            return self.values[key]
+        return self.values[self.schema.index[key]]
+
+    def as_dict(self):
+        return dict(zip(self.schema.names, self.values))
+
+
+class TelemetryBatch:
+    """
+    A run of packets stored column-wise, one array per field. Columns can be looked up by name or by schema index.
+    `times` holds the wall-clock receive time of each packet.
+    """
+
+    def __init__(self, schema, columns, lines, times):
+        self.schema = schema
+        self.columns = columns
+        self.column_list = [columns[name] for name in schema.names]
+        self.lines = lines
+        self.times = times
+        # Set on packets replayed only to refill the displays, which shouldn't be logged a second time
+        self.warmup = False
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, key):
+        if type(key) is int:
+            return self.column_list[key]
+        return self.columns[key]
+
+    def packet(self, index):
+        return TelemetryPacket(self.schema, tuple(column[index] for column in self.column_list))
+
+    @staticmethod
+    def concatenate(batches):
+        if len(batches) == 1:
+            return batches[0]
+        schema = batches[0].schema
+        columns = {name: np.concatenate([batch.columns[name] for batch in batches]) for name in schema.names}
+        return TelemetryBatch(schema, columns, [text for batch in batches for text in batch.lines],
+                              np.concatenate([batch.times for batch in batches]))
+
+    def packets(self):
+        for values in zip(*[column.tolist() for column in self.column_list]):
+            yield TelemetryPacket(self.schema, values)
+
+
 class CommsParser(QObject):
 
-    parsed = pyqtSignal(dict)
+    parsed = pyqtSignal(object)
+    parsed_batch = pyqtSignal(object)
     packet = pyqtSignal(str)
+    packet_batch = pyqtSignal(list)
     command = pyqtSignal(str)
     message = pyqtSignal(str)
     error = pyqtSignal(str)
     warning = pyqtSignal(str)
+    # A line that looked like a packet but couldn't be parsed, and why
+    malformed = pyqtSignal(str, str)
     csv_headers = pyqtSignal(str)
+    link_stats = pyqtSignal(dict)
+    stream_reset = pyqtSignal()
 
-    def __init__(self, names, exponents):
+    def __init__(self, names, exponents, sequence_key=None, stats_interval=0.5):
         super().__init__()
-        self.names = names
-        self.exponents = exponents
-        assert (len(names) == len(exponents)), "Names and Exponents not same length"
+        self.schema = TelemetrySchema(names, exponents)
+        self.names = self.schema.names
+        self.exponents = self.schema.exponents
 
         self.first_parse = True
 
+        # Link statistics are updated for every batch but only sent to the GUI a couple of times a second, from a timer
+        # so the rate still drops to zero when the link goes quiet
+        self.sequence_key = sequence_key
+        self.stats = LinkStats()
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(int(stats_interval * 1000))
+        self.stats_timer.timeout.connect(self.emit_link_stats)
+
+    @pyqtSlot()
+    def start_stats(self):
+        # Called once the parser is running on its thread, which then owns the timer
+        self.stats_timer.start()
+
+    @pyqtSlot()
+    def stop_stats(self):
+        self.stats_timer.stop()
+
+    def emit_link_stats(self):
+        self.link_stats.emit(self.stats.snapshot(time.time()))
+
+    @pyqtSlot()
+    def reset_stream(self):
+        # The packets that follow don't continue on from the ones before, e.g. a replay that has been seeked
+        self.stats.reset()
+        self.stream_reset.emit()
+
+    @pyqtSlot(str)
     def parse(self, text):
+        self.parse_batch([text])
+
+    @pyqtSlot(list)
+    @pyqtSlot(list, list)
+    def parse_batch(self, lines, times=None):
 
         if self.first_parse:
             self.first_parse = False
             self.csv_headers.emit(",".join(self.names))
 
-        if text.startswith("CMD TX:"):
-            self.command.emit(text)
+        if times is None:
+            times = [time.time()] * len(lines)
+
+        run = []
+        run_times = []
+        for text, receive_time in zip(lines, times):
+            signal, value = self.classify(text)
+            if signal is None:
+                run.append(text)
+                run_times.append(receive_time)
+            else:
+                # Keep log output in arrival order by flushing the packets that came before this line first
+                self.parse_run(run, run_times)
+                run = []
+                run_times = []
+                signal.emit(value)
+        self.parse_run(run, run_times)
+
+    @pyqtSlot(list, list)
+    def parse_warmup(self, lines, times):
+        # Packets replayed after a seek. They go to the displays only, not the logs, packet signals or link stats.
+        batch, rejects = self.schema.parse_columns([text for text in lines if self.classify(text)[0] is None], times)
+        if len(batch):
+            batch.warmup = True
+            self.parsed_batch.emit(batch)
+
+    def parse_run(self, lines, times):
+        if not lines:
             return
 
+        batch, rejects = self.schema.parse_columns(lines, times)
+        if len(batch):
+            self.emit_packets(batch)
+        for text, e in rejects:
+            self.malformed.emit(text, str(e))
+
+    def emit_packets(self, batch):
+        # Per-packet signals are only worth emitting if something still listens to them
+        if self.receivers(self.parsed) > 0:
+            for packet in batch.packets():
+                self.parsed.emit(packet)
+        if self.receivers(self.packet) > 0:
+            for text in batch.lines:
+                self.packet.emit(text)
+
+        self.parsed_batch.emit(batch)
+        self.packet_batch.emit(batch.lines)
+
+        if self.sequence_key is not None:
+            self.stats.update(batch[self.sequence_key], batch.times)
+
+    def classify(self, text):
+
+        if text.startswith("CMD TX:"):
+            return self.command, text
+
         if "unexpected" in text or "Too many retries" in text or "failed" in text:
-            self.error.emit(text)
-            return
+            return self.error, text
 
-        comma_count = text.count(",")
-        if comma_count > 0 and comma_count != len(self.names)-1:
-            print("Attempted to parse malformed packet")
-            self.warning.emit(text)
-            return
-        elif comma_count <= 0:
+        if "," not in text:
             if is_number(text):
-                self.warning.emit(text)
+                return self.warning, text
             else:
-                self.message.emit(text)
-            return
-
-        value_array = text.split(",")
+                return self.message, text
 
-        output_dict = {}
-
-        for i in range(0, len(self.names)):
-            try:
-                if type(self.exponents[i]) is int:
-                    output_dict[self.names[i]] = float(value_array[i]) * 10.0**float(self.exponents[i])
-                else:
-                    output_dict[self.names[i]] = value_array[i]
-            except:
-                print("Parse failure\n")
-
-        self.parsed.emit(output_dict)
-        self.packet.emit(text)
+        return None, text
@@ -0,0 +1,87 @@
+import threading
+from collections import deque
+
+from PyQt5.QtCore import *
+
+from CommsParser import TelemetryBatch
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+
+
+class DisplayQueue(QObject):
+    """
+    Bounded, non-blocking hand-off of parsed batches from the parser thread to the GUI thread.
+
+    The GUI gets everything waiting as one merged batch. When full, the oldest batch is dropped or the newest coalesced.
+    """
+
+    batch = pyqtSignal(object)
+    ready = pyqtSignal()
+    reset = pyqtSignal()
+
+    def __init__(self, max_depth=32, policy=DROP_OLDEST):
+        super().__init__()
+        assert policy in (DROP_OLDEST, COALESCE), "Unknown overflow policy"
+        self.max_depth = max_depth
+        self.policy = policy
+
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.reset_pending = False
+
+        self.depth_high_water = 0
+        self.dropped_batches = 0
+        self.dropped_packets = 0
+        self.coalesced = 0
+
+        self.ready.connect(self.drain, Qt.QueuedConnection)
+
+    def put(self, batch):
+        with self.lock:
+            was_empty = not self.queue and not self.reset_pending
+            if len(self.queue) >= self.max_depth:
+                if self.policy == DROP_OLDEST:
+                    dropped = self.queue.popleft()
+                    self.dropped_batches += 1
+                    self.dropped_packets += len(dropped)
+                    self.queue.append(batch)
+                else:
+                    self.queue[-1] = TelemetryBatch.concatenate([self.queue[-1], batch])
+                    self.coalesced += 1
+            else:
+                self.queue.append(batch)
+            self.depth_high_water = max(self.depth_high_water, len(self.queue))
+        if was_empty:
+            self.ready.emit()
+
+    def drain(self):
+        with self.lock:
+            batches = list(self.queue)
+            self.queue.clear()
+            reset, self.reset_pending = self.reset_pending, False
+        if reset:
+            self.reset.emit()
+        if batches:
+            self.batch.emit(TelemetryBatch.concatenate(batches))
+
+    def clear(self):
+        # Called on the parser thread when the stream restarts, e.g. after seeking in a replay. The reset is handed to
+        # the GUI by the next drain, ahead of the first batch that was put after it.
+        with self.lock:
+            was_empty = not self.queue and not self.reset_pending
+            self.queue.clear()
+            self.reset_pending = True
+        if was_empty:
+            self.ready.emit()
+
+    def depth(self):
+        with self.lock:
+            return len(self.queue)
+
+    def stats(self):
+        return {"depth": self.depth(),
+                "depth_high_water": self.depth_high_water,
+                "dropped_batches": self.dropped_batches,
+                "dropped_packets": self.dropped_packets,
+                "coalesced": self.coalesced}
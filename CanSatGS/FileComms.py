@@ -1,4 +1,5 @@
-import queue
+import mmap
+import threading
 import time
 
 import serial
@@ -6,6 +7,9 @@ import serial.tools.list_ports
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
+from LineFramer import LineBatcher, LineFramer
+from ReplayIndex import PACKET_FIELDS, ReplayIndex, packet_values
+
 
 
 
@@ -14,12 +18,29 @@ class FileConnectionWidget(QWidget):
     opened = pyqtSignal()
     closed = pyqtSignal()
     received = pyqtSignal(str)
+    received_batch = pyqtSignal(list, list)
+    warmup_batch = pyqtSignal(list, list)
+    seeked = pyqtSignal()
+
+    speeds = {"1x": 1, "4x": 4, "10x": 10, "Max": 0}
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, batch_interval=0.016, warmup_packets=600, **kwargs):
         super().__init__(*args, **kwargs)
         self.threadpool = QThreadPool()
+        # Room for playback and an index build at the same time
+        self.threadpool.setMaxThreadCount(max(self.threadpool.maxThreadCount(), 2))
 
         self.file_name = ""
+        self.batch_interval = batch_interval
+        self.comm_thread = None
+        self.parser = None
+
+        # Seeking needs the file's index, built in the background. warmup_packets before the seek point are replayed at
+        # once so the displays have some history again straight away.
+        self.index = None
+        self.index_file = None
+        self.warmup_packets = warmup_packets
+        self.start_index = 0
 
         self.init_ui()
 
@@ -32,29 +53,199 @@ class FileConnectionWidget(QWidget):
         self.raw_btn.clicked.connect(self.show_open_file_dialog)
 
         self.start_btn = QPushButton("Start Playback")
-        self.start_btn.clicked.connect(self.open_file)
+        self.start_btn.clicked.connect(self.toggle_playback)
+
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setEnabled(False)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+
+        self.speed_box = QComboBox()
+        self.speed_box.addItems(self.speeds.keys())
+        self.speed_box.currentTextChanged.connect(self.set_speed)
+
+        self.loop_box = QCheckBox("Loop")
+
+        self.jump_box = QComboBox()
+        self.jump_box.setEnabled(False)
+        self.jump_box.activated.connect(self.jump_to_event)
+
+        self.timeline = QSlider(Qt.Horizontal)
+        self.timeline.setEnabled(False)
+        self.timeline.sliderMoved.connect(self.show_position)
+        self.timeline.sliderReleased.connect(self.seek_timeline)
+        self.timeline.valueChanged.connect(self.on_timeline_changed)
+
+        self.position_label = QLabel("No file")
 
         layout.addWidget(self.raw_btn, 0, 0)
         layout.addWidget(self.start_btn, 1, 0)
+        layout.addWidget(self.speed_box, 0, 1)
+        layout.addWidget(self.pause_btn, 1, 1)
+        layout.addWidget(self.loop_box, 2, 0)
+        layout.addWidget(self.jump_box, 2, 1)
+        layout.addWidget(self.timeline, 3, 0, 1, 2)
+        layout.addWidget(self.position_label, 4, 0, 1, 2)
 
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
 
+    def set_edit_state(self, editable):
+        self.raw_btn.setEnabled(editable)
+        self.loop_box.setEnabled(editable)
+        self.pause_btn.setEnabled(not editable)
+        self.pause_btn.setText("Pause")
+        self.start_btn.setText("Start Playback" if editable else "Stop Playback")
+
+    def toggle_playback(self):
+        if self.comm_thread is None:
+            self.open_file()
+        else:
+            self.close_file()
+
+    def toggle_pause(self):
+        if self.comm_thread is not None:
+            paused = not self.comm_thread.paused
+            self.comm_thread.set_paused(paused)
+            self.pause_btn.setText("Resume" if paused else "Pause")
+
+    def set_speed(self, text):
+        if self.comm_thread is not None:
+            self.comm_thread.set_speed(self.speeds[text])
+
+    def set_parser(self, parser):
+        # With a parser set, playback goes from the comm thread straight to the parser's thread rather than being
+        # passed on by the GUI thread. Seeks take the same route so they stay in order with the lines around them.
+        self.parser = parser
+
+    def thread_connections(self):
+        receivers = [self.on_receive, self.on_receive_batch, self.on_receive_warmup, self.on_seeked]
+        if self.parser is not None:
+            parser = self.parser
+            receivers = [parser.parse, parser.parse_batch, parser.parse_warmup, parser.reset_stream]
+        signals = self.comm_thread.signals
+        senders = [signals.receive, signals.receive_batch, signals.warmup_batch, signals.seeked]
+        return list(zip(senders, receivers)) + [(signals.finished, self.on_finished), (signals.progress, self.on_progress)]
 
     def on_receive(self, text):
         self.received.emit(text.strip())
 
+    def on_receive_batch(self, lines, times):
+        self.received_batch.emit(lines, times)
+
+    def on_receive_warmup(self, lines, times):
+        self.warmup_batch.emit(lines, times)
+
+    def on_seeked(self):
+        self.seeked.emit()
+
+    def on_progress(self, index):
+        if self.index is not None and not self.timeline.isSliderDown():
+            self.timeline.blockSignals(True)
+            self.timeline.setValue(min(index, len(self.index) - 1))
+            self.timeline.blockSignals(False)
+            self.show_position(self.timeline.value())
+
+    def load_index(self):
+        self.index = None
+        self.index_file = self.file_name
+        self.start_index = 0
+        self.timeline.setEnabled(False)
+        self.jump_box.setEnabled(False)
+        self.position_label.setText("Indexing log...")
+
+        index_thread = IndexThread(self.file_name)
+        index_thread.signals.progress.connect(self.on_index_progress)
+        index_thread.signals.ready.connect(self.on_index_ready)
+        index_thread.signals.failed.connect(self.on_index_failed)
+        self.threadpool.start(index_thread)
+
+    def on_index_progress(self, file_name, percent):
+        if file_name == self.index_file:
+            self.position_label.setText(f"Indexing log... {percent}%")
+
+    def on_index_failed(self, file_name, text):
+        if file_name == self.index_file:
+            self.position_label.setText(f"Couldn't index log: {text}")
+
+    def on_index_ready(self, file_name, index):
+        # A slow index for a file that has since been replaced by another one is thrown away
+        if file_name != self.index_file:
+            return
+        self.index = index
+        self.timeline.blockSignals(True)
+        self.timeline.setRange(0, max(len(self.index) - 1, 0))
+        self.timeline.setValue(0)
+        self.timeline.blockSignals(False)
+        self.timeline.setEnabled(len(self.index) > 0)
+
+        self.jump_box.clear()
+        self.jump_box.addItem("Jump to...", -1)
+        for label, index in self.index.events():
+            self.jump_box.addItem(label, index)
+        self.jump_box.setEnabled(len(self.index) > 0)
+        if self.comm_thread is None:
+            self.show_position(0)
+
+    def show_position(self, index):
+        if self.index is not None and len(self.index):
+            self.position_label.setText(f"Packet {self.index.packet_count[index]}, "
+                                        f"T+{self.index.mission_time[index]:.1f} s "
+                                        f"({index + 1}/{len(self.index)})")
+
+    def on_timeline_changed(self, index):
+        # Dragging only previews, the seek happens on release. Clicks and arrow keys seek straight away.
+        if not self.timeline.isSliderDown():
+            self.seek_to(index)
+
+    def seek_timeline(self):
+        self.seek_to(self.timeline.value())
+
+    def jump_to_event(self, item):
+        index = self.jump_box.itemData(item)
+        if index is not None and index >= 0:
+            self.timeline.blockSignals(True)
+            self.timeline.setValue(index)
+            self.timeline.blockSignals(False)
+            self.seek_to(index)
+        self.jump_box.setCurrentIndex(0)
+
+    def seek_to(self, index):
+        if self.index is None or not len(self.index):
+            return
+        self.show_position(index)
+        offset = int(self.index.offsets[index])
+        warmup_offset = self.index.window_start(index, self.warmup_packets)
+        if self.comm_thread is not None:
+            self.comm_thread.seek(warmup_offset, offset, index)
+        else:
+            self.start_index = index
+
+    def on_finished(self):
+        if self.comm_thread is not None:
+            self.close_file()
+
     def open_file(self):
         print("Opening File")
-        self.comm_thread = FileCommThread(self.file_name)
-        self.comm_thread.signals.receive.connect(self.on_receive)
+        start = {}
+        if self.index is not None and self.start_index > 0:
+            start = {"start_offset": int(self.index.offsets[self.start_index]), "start_index": self.start_index,
+                     "warmup_offset": self.index.window_start(self.start_index, self.warmup_packets)}
+        self.comm_thread = FileCommThread(self.file_name, batch_interval=self.batch_interval,
+                                          speed=self.speeds[self.speed_box.currentText()],
+                                          loop=self.loop_box.isChecked(), **start)
+        for signal, slot in self.thread_connections():
+            signal.connect(slot)
         self.threadpool.start(self.comm_thread)
 
+        self.set_edit_state(False)
         self.opened.emit()
 
     def close_file(self):
         print("Closing File")
-        self.comm_thread.signals.receive.disconnect(self.on_receive)
+        for signal, slot in self.thread_connections():
+            signal.disconnect(slot)
         self.comm_thread.close_port()
+        self.comm_thread = None
+        self.start_index = 0
 
         self.closed.emit()
         self.set_edit_state(True)
@@ -66,57 +257,195 @@ class FileConnectionWidget(QWidget):
                                                    options=options)
         if file_name:
             self.file_name = file_name
+            self.load_index()
+
+
+def read_lines(filename, start=0, stop=None, chunk_size=16384):
+    # Streams a log through a memory map a chunk at a time, so memory use doesn't grow with the size of the file and
+    # the first packets can go out before the rest has been read. start and stop are byte offsets of line starts.
+    with open(filename, "rb") as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return
+        with mapped:
+            end = len(mapped) if stop is None else min(stop, len(mapped))
+            # Chunks stay well under the framer's buffer so a partial line plus the next chunk always fits
+            framer = LineFramer()
+            for position in range(start, end, chunk_size):
+                yield from framer.feed(mapped[position:min(position + chunk_size, end)])
+            yield from framer.finish()
+
+
+class IndexThreadSignals(QObject):
+    progress = pyqtSignal(str, int)
+    ready = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+
+class IndexThread(QRunnable):
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self.signals = IndexThreadSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            index = ReplayIndex(self.filename, progress=lambda done: self.signals.progress.emit(self.filename,
+                                                                                                 int(done * 100)))
+        except OSError as e:
+            self.signals.failed.emit(self.filename, str(e))
+            return
+        self.signals.ready.emit(self.filename, index)
 
 
 class FileThreadSignals(QObject):
     receive = pyqtSignal(str)
+    receive_batch = pyqtSignal(list, list)
+    # Packets from before a seek point, sent again only to refill the displays
+    warmup_batch = pyqtSignal(list, list)
+    finished = pyqtSignal()
+    seeked = pyqtSignal()
+    progress = pyqtSignal(int)
 
 
 class FileCommThread(QRunnable):
+    """
+    Plays a raw log back as if it were arriving over the radio, paced by mission_time divided by `speed` (0 is as
+    fast as possible). Seeks replay the packets from warmup_offset unpaced so the displays have some history.
+    """
 
-    def __init__(self, filename):
+    def __init__(self, filename, batch_interval=0, speed=1, loop=False, fields=PACKET_FIELDS, time_scale=0.001,
+                 max_gap=5.0, start_offset=0, start_index=0, warmup_offset=None):
         super().__init__()
 
         self.filename = filename
+        self.start = (warmup_offset, start_offset, start_index)
+        self.seek_request = None
+        self.position = start_index
+        self.speed = speed
+        self.loop = loop
+        self.fields = fields
+        self.time_scale = time_scale
+        self.max_gap = max_gap
 
         self.signals = FileThreadSignals()
+        self.batcher = LineBatcher(batch_interval, self.signals.receive.emit, self.signals.receive_batch.emit)
 
+        # Set whenever the thread should stop waiting early: closing, pausing, resuming or a speed change
+        self.wake = threading.Event()
+        self.paused = False
         self.close_flag = False
 
-    @pyqtSlot()
-    def run(self):
-        max_tries = 99999
-        num_tries = max_tries
-        while not self.close_flag and num_tries > 0:
-            try:
-                if num_tries < max_tries:
-                    self.signals.receive.emit("Reconnected")
-                else:
-                    self.signals.receive.emit("Connected")
-                num_tries = max_tries
-                file = open(self.filename, "r")
-
-                lines = file.readlines()
-                for line in lines:
-
-                    self.signals.receive.emit(line)
-                    time.sleep(0.25)
-
-                file.close()
-            except:
-                if num_tries < max_tries:
-                    self.signals.receive.emit("Retry failed")
-                else:
-                    self.signals.receive.emit("File closed unexpectedly")
-                print("File Closed Unexpectedly")
-                try:
-                    file.close()
-                except:
-                    pass
-            num_tries -= 1
-            time.sleep(0.5)
-        self.signals.receive.emit("Too many retries (Close and reopen file to reset)")
+    def set_speed(self, speed):
+        self.speed = speed
+        self.wake.set()
+
+    def set_paused(self, paused):
+        self.paused = paused
+        self.wake.set()
 
+    def seek(self, warmup_offset, offset, index):
+        self.seek_request = (warmup_offset, offset, index)
+        self.wake.set()
 
     def close_port(self):
         self.close_flag = True
+        self.wake.set()
+
+    def packet_time(self, line):
+        values = packet_values(line, self.fields)
+        return values[0] * self.time_scale if values is not None else None
+
+    def hold(self):
+        # Blocks for as long as playback is paused, at any speed. A seek ends it so scrubbing works while paused.
+        while self.paused and not self.close_flag and self.seek_request is None:
+            self.batcher.flush()
+            self.wake.wait()
+            self.wake.clear()
+
+    def wait_until(self, deadline):
+        # Returns False if the wait was cut short by a pause or speed change, so the clock needs re-anchoring
+        while not self.close_flag:
+            self.wake.clear()
+            if self.seek_request is not None:
+                return True
+            if self.paused:
+                self.hold()
+                return False
+            delay = deadline - time.perf_counter()
+            if delay <= 0:
+                return True
+            if self.wake.wait(delay):
+                return False
+        return True
+
+    def play(self, lines):
+        # Playback runs on a clock anchored to one packet's mission_time, so sleep overshoot doesn't build up
+        anchor = None
+        previous = None
+        last_progress = 0
+        for line in lines:
+            if self.paused:
+                self.hold()
+                anchor = None
+            if self.close_flag or self.seek_request is not None:
+                return
+            packet_time = self.packet_time(line)
+            if packet_time is not None:
+                step = packet_time - previous if previous is not None else 0
+                if anchor is None or not 0 <= step <= self.max_gap:
+                    anchor = (time.perf_counter() + (self.max_gap if step > self.max_gap else 0) / max(self.speed, 1),
+                              packet_time)
+                while self.speed > 0:
+                    deadline = anchor[0] + (packet_time - anchor[1]) / self.speed
+                    if deadline - time.perf_counter() >= self.batcher.interval:
+                        self.batcher.flush()
+                    if self.wait_until(deadline):
+                        break
+                    anchor = (time.perf_counter(), previous if previous is not None else packet_time)
+                if self.seek_request is not None:
+                    return
+                previous = packet_time
+
+                self.position += 1
+                if time.perf_counter() - last_progress >= 0.1:
+                    last_progress = time.perf_counter()
+                    self.signals.progress.emit(self.position)
+
+            self.batcher.add([line])
+            self.batcher.poll()
+        self.batcher.flush()
+
+    def play_from(self, warmup_offset, offset, index):
+        self.batcher.flush()
+        self.position = index
+        if warmup_offset is not None:
+            self.signals.seeked.emit()
+            warmup = [line for line in read_lines(self.filename, warmup_offset, offset)
+                      if self.packet_time(line) is not None]
+            if warmup:
+                self.signals.warmup_batch.emit(warmup, [time.time()] * len(warmup))
+        self.signals.progress.emit(self.position)
+        self.play(read_lines(self.filename, offset))
+
+    @pyqtSlot()
+    def run(self):
+        self.signals.receive.emit("Connected")
+        try:
+            while not self.close_flag:
+                self.play_from(*self.start)
+                if self.seek_request is not None:
+                    self.start, self.seek_request = self.seek_request, None
+                    continue
+                if not self.loop:
+                    break
+                self.start = (None, 0, 0)
+        except OSError as e:
+            self.signals.receive.emit(f"Playback failed: {e}")
+            print("File Closed Unexpectedly")
+        self.signals.receive.emit("Playback finished")
+        self.signals.finished.emit()
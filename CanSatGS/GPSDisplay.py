@@ -8,32 +8,39 @@ from pyqtgraph import opengl
 from stl import mesh
 
 import GLViewWidgetFix
+from CommsParser import field_index
+from TelemetryStore import StoreDisplay
 
 
 
-class GPSDisplay(QWidget):
+class GPSDisplay(QWidget, StoreDisplay):
 
-    def __init__(self, lat_key, lon_key, alt_key, sats_key, image_name="", lat_min=0, lat_max=0, lon_min=0, lon_max=0, max_points=250):
+    def __init__(self, lat_key, lon_key, alt_key, sats_key, image_name="", lat_min=0, lat_max=0, lon_min=0, lon_max=0,
+                 max_points=250, schema=None, store=None, scheduler=None):
         super().__init__()
 
         self.image_name = image_name
 
-        self.lat_key = lat_key
-        self.lon_key = lon_key
-        self.alt_key = alt_key
-        self.sats_key = sats_key
+        self.lat_key = field_index(schema, lat_key)
+        self.lon_key = field_index(schema, lon_key)
+        self.alt_key = field_index(schema, alt_key)
+        self.sats_key = field_index(schema, sats_key)
 
         self.lat_min = lat_min
         self.lat_max = lat_max
         self.lon_min = lon_min
         self.lon_max = lon_max
 
-        self.x_points = np.array([])
-        self.y_points = np.array([])
-        self.z_points = np.array([])
-
         self.max_points = max_points
 
+        self.init_store(schema, store, max_points, scheduler, self.update_points)
+
+        # Track vertices in a float32 ring written twice, like the TelemetryStore, so the newest max_points are always
+        # one contiguous (n, 3) view. Each fix is converted and written once; the line item draws straight from the
+        # view. z is always the real altitude and 2D mode flattens it with the item's transform.
+        self.track = np.zeros((2 * max_points, 3), dtype=np.float32)
+        self.track_total = 0
+
         self.meters_per_lat = 111000
         self.meters_per_lon = math.cos((lat_min+lat_max)*math.pi/360) * 111321
 
@@ -41,6 +48,11 @@ class GPSDisplay(QWidget):
 
         self.init_ui()
 
+        count = len(self.store)
+        self.add_fixes(self.store.view(self.lat_key, count), self.store.view(self.lon_key, count),
+                       self.store.view(self.alt_key, count))
+        self.update_points()
+
     def init_ui(self):
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.setMinimumSize(250, 250)
@@ -48,14 +60,13 @@ class GPSDisplay(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         self.setLayout(layout)
 
-        positions = np.vstack([self.x_points, self.y_points, self.z_points]).transpose()
-
         self.view = GLViewWidgetFix.GLViewWidgetFix()
         self.view.setBackgroundColor(119, 181, 254)
         self.view.setCameraPosition(distance=1950, elevation=90, azimuth=0)
 
-        self.plot = opengl.GLLinePlotItem(pos=positions, color=[1,0,0,1], width=3)
+        self.plot = opengl.GLLinePlotItem(pos=self.track[:0], color=[1,0,0,1], width=3)
         self.plot.setGLOptions("opaque")
+        self.flatten_track()
         self.view.addItem(self.plot)
 
         # self.grid = opengl.GLGridItem(color="white")
@@ -116,28 +127,44 @@ class GPSDisplay(QWidget):
 
 
 
-    def update_plot(self, dictionary):
-        self.coords_label.setText(f"{dictionary[self.lat_key]:.5f},{dictionary[self.lon_key]:.5f}")
-        self.sats_label.setText(f"{dictionary[self.sats_key]:02.0f}")
-        if dictionary[self.lat_key] != 0 and dictionary[self.lon_key] != 0:
-            self.x_points = np.append(self.x_points, -(dictionary[self.lat_key]-(self.lat_min+self.lat_max)/2) * self.meters_per_lat)
-            self.y_points = np.append(self.y_points, (dictionary[self.lon_key]-(self.lon_min+self.lon_max)/2) * self.meters_per_lon)
-            self.z_points = np.append(self.z_points, dictionary[self.alt_key])
-
-            if self.x_points.size > self.max_points:
-                self.x_points = np.delete(self.x_points, 0)
-            if self.y_points.size > self.max_points:
-                self.y_points = np.delete(self.y_points, 0)
-            if self.z_points.size > self.max_points:
-                self.z_points = np.delete(self.z_points, 0)
-
-            if self.do3d:
-                positions = np.vstack([self.x_points, self.y_points, self.z_points]).transpose()
-            else:
-                positions = np.vstack([self.x_points, self.y_points, np.ones([1, self.x_points.size])]).transpose()
-
-            self.set_crosshair_pos(self.x_points[-1], self.y_points[-1], 0)
-
+    def update_plot(self, packet):
+        self.store_packet(packet)
+        self.add_fixes((packet[self.lat_key],), (packet[self.lon_key],), (packet[self.alt_key],))
+        self.coords_label.setText(f"{packet[self.lat_key]:.5f},{packet[self.lon_key]:.5f}")
+        self.sats_label.setText(f"{packet[self.sats_key]:02.0f}")
+        self.schedule_redraw()
+
+    def update_batch(self, batch):
+        self.store_batch(batch)
+        self.add_fixes(batch[self.lat_key], batch[self.lon_key], batch[self.alt_key])
+        self.coords_label.setText(f"{batch[self.lat_key][-1]:.5f},{batch[self.lon_key][-1]:.5f}")
+        self.sats_label.setText(f"{batch[self.sats_key][-1]:02.0f}")
+        self.schedule_redraw()
+
+    def add_fixes(self, lat, lon, alt):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        fixes = (lat != 0) & (lon != 0)
+        if not fixes.any():
+            return
+        kept = min(int(fixes.sum()), self.max_points)
+        vertices = np.empty((kept, 3), dtype=np.float32)
+        vertices[:, 0] = -(lat[fixes][-kept:]-(self.lat_min+self.lat_max)/2) * self.meters_per_lat
+        vertices[:, 1] = (lon[fixes][-kept:]-(self.lon_min+self.lon_max)/2) * self.meters_per_lon
+        vertices[:, 2] = np.asarray(alt, dtype=np.float64)[fixes][-kept:]
+
+        total = self.track_total + int(fixes.sum())
+        positions = (total - kept + np.arange(kept)) % self.max_points
+        self.track[positions] = vertices
+        self.track[positions + self.max_points] = vertices
+        self.track_total = total
+
+    def update_points(self):
+        count = min(self.track_total, self.max_points)
+        if count:
+            end = self.track_total % self.max_points + self.max_points
+            positions = self.track[end - count:end]
+            self.set_crosshair_pos(positions[-1, 0], positions[-1, 1], 0)
             self.plot.setData(pos=positions)
 
     def switch_3d(self):
@@ -149,6 +176,14 @@ class GPSDisplay(QWidget):
             self.view_btn.setText("3D")
             self.do3d = True
             self.view.setCameraPosition(distance=3000, elevation=45, azimuth=45)
+        self.flatten_track()
+
+    def flatten_track(self):
+        # 2D draws the track just above the map by scaling z to nothing, without touching the vertices
+        self.plot.resetTransform()
+        if not self.do3d:
+            self.plot.translate(0, 0, 1)
+            self.plot.scale(1, 1, 0, local=True)
 
     def set_crosshair_pos(self, x, y, z):
         self.crosshair.resetTransform()
@@ -156,18 +191,6 @@ class GPSDisplay(QWidget):
         self.crosshair.translate(x, y, z)
 
     def clear_plot(self):
-        self.x_points = np.array([])
-        self.y_points = np.array([])
-        self.z_points = np.array([])
-
-        if self.do3d:
-            positions = np.vstack([self.x_points, self.y_points, self.z_points]).transpose()
-        else:
-            positions = np.vstack([self.x_points, self.y_points, np.ones([1, self.x_points.size])]).transpose()
-
+        self.track_total = 0
         self.set_crosshair_pos(0, 0, 0)
-
-        self.plot.setData(pos=positions)
-
-
-
+        self.plot.setData(pos=self.track[:0])
@@ -0,0 +1,178 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from CommsParser import PACKET_EXPONENTS, PACKET_NAMES, CommsParser
+from FileComms import read_lines
+from LogWriter import LogWriter
+from MissionArchive import SCHEMA_FILE, TIME_FIELD, ArchiveWriter, field_path
+
+
+class ChannelStats:
+    """
+    Running count, min, max, mean and standard deviation of every numeric field, updated a batch at a time.
+    """
+
+    def __init__(self, schema):
+        self.names = [schema.names[i] for i, multiplier in schema.numeric]
+        count = len(self.names)
+        self.count = 0
+        self.total = np.zeros(count)
+        self.total_squares = np.zeros(count)
+        self.minimum = np.full(count, np.inf)
+        self.maximum = np.full(count, -np.inf)
+
+    def update(self, batch):
+        table = np.array([batch[name] for name in self.names])
+        self.count += table.shape[1]
+        self.total += table.sum(axis=1)
+        self.total_squares += np.square(table).sum(axis=1)
+        np.minimum(self.minimum, table.min(axis=1), out=self.minimum)
+        np.maximum(self.maximum, table.max(axis=1), out=self.maximum)
+
+    def summary(self):
+        if not self.count:
+            return {}
+        mean = self.total / self.count
+        std = np.sqrt(np.maximum(self.total_squares / self.count - np.square(mean), 0))
+        return {name: {"min": float(self.minimum[i]), "max": float(self.maximum[i]), "mean": float(mean[i]),
+                       "std": float(std[i])}
+                for i, name in enumerate(self.names)}
+
+
+def output_path(log_file, out_dir, extension):
+    name = os.path.splitext(os.path.basename(log_file))[0] + extension
+    return os.path.join(out_dir or os.path.dirname(log_file), name)
+
+
+def remove_output(path, schema):
+    # Only what a conversion would have written is removed, anything else in an archive directory is left alone
+    if os.path.isdir(path):
+        for name in [SCHEMA_FILE] + [os.path.basename(field_path(path, name)) for name in schema.names + [TIME_FIELD]]:
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def process_log(log_file, output_format="csv", out_dir=None, chunk_lines=4096, force=False):
+    # Runs one raw log through the same parser the GUI uses. Signals are delivered directly since everything here is
+    # on one thread, so no Qt application or event loop is needed.
+    start = time.perf_counter()
+    # Fail before creating any output for a log that isn't there
+    os.stat(log_file)
+    parser = CommsParser(PACKET_NAMES, PACKET_EXPONENTS, sequence_key="packet_count")
+    stats = ChannelStats(parser.schema)
+    counts = {"packets": 0, "malformed": 0, "messages": 0}
+
+    # The writers append, so an old output is either refused or cleared first rather than added to
+    path = None
+    if output_format in ("csv", "archive"):
+        path = output_path(log_file, out_dir, ".csv" if output_format == "csv" else ".gsa")
+        if os.path.exists(path):
+            if not force:
+                raise FileExistsError(f"{path} already exists, use --force to overwrite it")
+            remove_output(path, parser.schema)
+
+    writer = None
+    headers = ",".join(parser.names)
+    if output_format == "csv":
+        writer = LogWriter(path)
+    elif output_format == "archive":
+        writer = ArchiveWriter(path, parser.schema)
+
+    def on_batch(batch):
+        counts["packets"] += len(batch)
+        stats.update(batch)
+        if output_format == "csv":
+            # Same layout CommsLog writes: the header once at the top of a new file, then the raw packet lines
+            if writer.is_empty:
+                writer.write_line(headers)
+            writer.write_lines(batch.lines)
+        elif output_format == "archive":
+            writer.write_batch(batch)
+
+    def on_malformed(*args):
+        counts["malformed"] += 1
+
+    def on_message(text):
+        counts["messages"] += 1
+
+    parser.parsed_batch.connect(on_batch)
+    parser.warning.connect(on_malformed)
+    parser.malformed.connect(on_malformed)
+    for signal in (parser.message, parser.command, parser.error):
+        signal.connect(on_message)
+
+    chunk = []
+    for line in read_lines(log_file):
+        chunk.append(line)
+        if len(chunk) >= chunk_lines:
+            parser.parse_batch(chunk)
+            chunk = []
+    parser.parse_batch(chunk)
+    if writer is not None:
+        writer.close()
+
+    link = parser.stats.snapshot()
+    return {"file": log_file,
+            "seconds": time.perf_counter() - start,
+            **counts,
+            "lost": link["lost"],
+            "duplicates": link["duplicates"],
+            "out_of_order": link["out_of_order"],
+            "counter_resets": link["resets"],
+            "channels": stats.summary()}
+
+
+def print_summary(result):
+    print(f"{result['file']}: {result['packets']} packets, {result['malformed']} malformed, "
+          f"{result['messages']} other lines, {result['lost']} lost, {result['duplicates']} duplicates "
+          f"({result['seconds']:.2f} s)")
+    for name, channel in result["channels"].items():
+        print(f"  {name:>16}: min {channel['min']:12.5g}  max {channel['max']:12.5g}  "
+              f"mean {channel['mean']:12.5g}  std {channel['std']:10.4g}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Convert raw ground station logs and summarise them, no GUI needed")
+    arg_parser.add_argument("logs", nargs="+", help="raw .txt logs")
+    arg_parser.add_argument("--format", choices=["csv", "archive", "none"], default="csv",
+                            help="what to write next to each log (default csv)")
+    arg_parser.add_argument("--out", default=None, help="directory for the output files, default beside each log")
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    arg_parser.add_argument("--stats", default=None, help="also write the summaries to this JSON file")
+    arg_parser.add_argument("--force", action="store_true", help="overwrite output files that already exist")
+    args = arg_parser.parse_args()
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    results = []
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = {pool.submit(process_log, log, args.format, args.out, force=args.force): log for log in args.logs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except (OSError, ValueError) as e:
+                print(f"{futures[future]}: failed ({e})", file=sys.stderr)
+                failed += 1
+                continue
+            print_summary(result)
+            results.append(result)
+
+    if args.stats:
+        results.sort(key=lambda result: args.logs.index(result["file"]))
+        with open(args.stats, "w") as file:
+            json.dump(results, file, indent=1)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
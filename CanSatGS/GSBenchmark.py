@@ -0,0 +1,313 @@
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import tty
+
+import numpy as np
+from PyQt5.QtCore import *
+
+import CommsParser
+import SerialComms as sc
+from LineFramer import LineFramer
+from LogWriter import LogWriter, LogWriterThread
+from TelemetryStore import TelemetryStore
+from TelemetrySimulator import TelemetrySimulator
+
+NAMES = CommsParser.PACKET_NAMES
+EXPONENTS = CommsParser.PACKET_EXPONENTS
+
+
+def legacy_serial_run(comm_thread, tx_queue):
+    # The original busy-polling loop, kept here so the benchmark has something to compare against. It has its own plain
+    # queue of bytes, the comm thread's is now a priority queue that close_port() puts a stop marker on.
+    comm_thread.ser.open()
+    while comm_thread.ser.is_open:
+        while comm_thread.ser.in_waiting > 0:
+            comm_thread.signals.receive.emit(comm_thread.ser.readline().decode("utf-8"))
+        if not tx_queue.empty():
+            comm_thread.ser.write(tx_queue.get())
+        if comm_thread.close_flag:
+            comm_thread.ser.close()
+
+
+def legacy_parse(names, exponents, text):
+    # The original per-field loop from CommsParser.parse, for comparison
+    value_array = text.split(",")
+    output_dict = {}
+    for i in range(0, len(names)):
+        try:
+            if type(exponents[i]) is int:
+                output_dict[names[i]] = float(value_array[i]) * 10.0**float(exponents[i])
+            else:
+                output_dict[names[i]] = value_array[i]
+        except:
+            print("Parse failure\n")
+    return output_dict
+
+
+def legacy_log_packet(raw_file, csv_file, headers, text):
+    # The original CommsLog path: open the raw log, then open and stat the CSV, for every packet
+    with open(raw_file, "a") as text_file:
+        text_file.write(text + "\n")
+    with open(csv_file, "a") as text_file:
+        if os.stat(csv_file).st_size == 0:
+            text_file.write(headers + "\n")
+        text_file.write(text + "\n")
+
+
+def open_pty():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave)
+
+
+def feed_pty(master, baud, line, stop):
+    # Serial sends 10 bits per byte (start + 8 data + stop), so pace writes to what the link could carry. With no baud
+    # the pty is kept full, which measures how fast the reader can drain it.
+    bytes_per_sec = baud / 10 if baud else 0
+    chunk = line * max(1, int(bytes_per_sec / 100 / len(line)) if baud else 64)
+    start = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        os.write(master, chunk)
+        sent += len(chunk)
+        delay = start + sent / bytes_per_sec - time.perf_counter() if baud else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def serial_benchmark(baud, legacy=False, idle_secs=2.0, load_secs=3.0):
+    line = b"2594,18218,181,0,97327,31,327,123638,3224468,-9820005,-6,4,-160,-160,389,LANDED,0\n"
+    master, port = open_pty()
+
+    comm_thread = sc.SerialCommThread(port, baud or 115200, timeout=1)
+    count = [0]
+
+    def on_receive(text):
+        count[0] += 1
+    comm_thread.signals.receive.connect(on_receive, Qt.DirectConnection)
+
+    runner = threading.Thread(target=legacy_serial_run if legacy else comm_thread.run,
+                              args=(comm_thread, queue.Queue()) if legacy else ())
+    runner.start()
+    time.sleep(0.2)
+
+    cpu_start = time.process_time()
+    time.sleep(idle_secs)
+    idle_cpu = (time.process_time() - cpu_start) / idle_secs * 100
+
+    stop = threading.Event()
+    feeder = threading.Thread(target=feed_pty, args=(master, baud, line, stop))
+    count[0] = 0
+    wall_start = time.perf_counter()
+    feeder.start()
+    time.sleep(load_secs)
+    received = count[0]
+    elapsed = time.perf_counter() - wall_start
+    stop.set()
+    feeder.join()
+
+    comm_thread.close_port()
+    runner.join()
+    os.close(master)
+
+    name = "legacy" if legacy else "current"
+    if baud:
+        print(f"{name:>8} {baud:>7} baud: idle CPU {idle_cpu:5.1f}%, {received / elapsed:8.1f} lines/sec "
+              f"(line rate {baud / 10 / len(line):.1f} lines/sec)")
+    else:
+        print(f"{name:>8} saturated: {received / elapsed:8.1f} lines/sec")
+
+
+def run_serial_benchmarks():
+    for baud in [115200, 256000, None]:
+        serial_benchmark(baud, legacy=True)
+        serial_benchmark(baud)
+
+
+def run_framing_benchmark(file_name="test.txt", chunk_size=4096, repeats=20):
+    with open(file_name, "rb") as file:
+        data = file.read() * repeats
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    start = time.perf_counter()
+    count = 0
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.decode("utf-8").strip():
+                count += 1
+    split_rate = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    count = 0
+    framer = LineFramer()
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    framer_rate = count / (time.perf_counter() - start)
+
+    print(f"split/decode/strip: {split_rate:10.0f} lines/sec")
+    print(f"LineFramer:         {framer_rate:10.0f} lines/sec")
+
+
+def run_parser_benchmark(file_name="test.txt", repeats=5):
+    with open(file_name, "r") as file:
+        lines = [line.strip() for line in file if line.count(",") == len(NAMES) - 1] * repeats
+
+    start = time.perf_counter()
+    for text in lines:
+        legacy_parse(NAMES, EXPONENTS, text)
+    legacy_rate = len(lines) / (time.perf_counter() - start)
+
+    # What the app runs: parse() for single lines and parse_batch() for batches, signals included
+    parser = CommsParser.CommsParser(NAMES, EXPONENTS)
+    start = time.perf_counter()
+    for text in lines:
+        parser.parse_batch([text])
+    single_rate = len(lines) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(lines), 64):
+        parser.parse_batch(lines[i:i + 64])
+    batch_rate = len(lines) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(lines), 64):
+        parser.schema.parse_columns(lines[i:i + 64])
+    columns_rate = len(lines) / (time.perf_counter() - start)
+
+    print(f"legacy parser:       {legacy_rate:10.0f} packets/sec")
+    print(f"parse_batch (x1):     {single_rate:10.0f} packets/sec")
+    print(f"parse_batch (x64):    {batch_rate:10.0f} packets/sec")
+    print(f"parse_columns (x64):  {columns_rate:10.0f} packets/sec")
+
+
+def run_log_benchmark(file_name="test.txt", repeats=5, batch=64):
+    with open(file_name, "r") as file:
+        lines = [line.strip() for line in file if line.count(",") == len(NAMES) - 1] * repeats
+    headers = ",".join(NAMES)
+
+    with tempfile.TemporaryDirectory() as directory:
+        raw_file = os.path.join(directory, "legacy.txt")
+        csv_file = os.path.join(directory, "legacy.csv")
+        start = time.perf_counter()
+        for text in lines:
+            legacy_log_packet(raw_file, csv_file, headers, text)
+        legacy_rate = len(lines) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        raw_writer = LogWriter(os.path.join(directory, "raw.txt"))
+        csv_writer = LogWriter(os.path.join(directory, "csv.csv"))
+        csv_writer.write_line(headers)
+        for i in range(0, len(lines), batch):
+            raw_writer.write_lines(lines[i:i + batch])
+            csv_writer.write_lines(lines[i:i + batch])
+        raw_writer.close()
+        csv_writer.close()
+        writer_rate = len(lines) / (time.perf_counter() - start)
+
+        # What the GUI thread pays is just the enqueue, the rest happens on the writer thread
+        writer_thread = LogWriterThread()
+        writer_thread.start()
+        start = time.perf_counter()
+        for i in range(0, len(lines), batch):
+            writer_thread.write(os.path.join(directory, "raw2.txt"), lines[i:i + batch])
+            writer_thread.write(os.path.join(directory, "csv2.csv"), lines[i:i + batch], headers)
+        enqueue_rate = len(lines) / (time.perf_counter() - start)
+        writer_thread.stop()
+        thread_rate = len(lines) / (time.perf_counter() - start)
+
+    print(f"open/stat/close per packet: {legacy_rate:10.0f} packets/sec")
+    print(f"LogWriter (x{batch}):          {writer_rate:10.0f} packets/sec")
+    print(f"LogWriterThread (x{batch}):    {thread_rate:10.0f} packets/sec, {enqueue_rate:.0f} packets/sec on the caller")
+
+
+def run_graph_benchmark(file_name="test.txt", packets=5000):
+    # The per-packet data path behind the screen's eleven graphs, without the drawing, at a range of window sizes
+    with open(file_name, "r") as file:
+        lines = [line.strip() for line in file if line.count(",") == len(NAMES) - 1]
+    parser = CommsParser.CommsParser(NAMES, EXPONENTS)
+    batch, rejects = parser.schema.parse_columns(lines)
+    stream = list(batch.packets())
+    stream = (stream * (packets // len(stream) + 1))[:packets]
+    index = parser.schema.index
+    graphs = [(index["mission_time"], index[name]) for name in ["altitude", "altitude", "pressure", "temp", "voltage",
+                                                                "voltage", "blade_spin_rate", "bonus_direction",
+                                                                "bonus_direction", "pitch", "roll"]]
+
+    for max_points in [150, 600, 2400, 9600]:
+        data = [(np.array([]), np.array([])) for graph in graphs]
+        start = time.perf_counter()
+        for packet in stream:
+            # The original np.append and trim in every graph, which copies each graph's whole window every packet
+            for i, (x_key, y_key) in enumerate(graphs):
+                x_data = np.append(data[i][0], packet[x_key])
+                y_data = np.append(data[i][1], packet[y_key])
+                if x_data.size > max_points:
+                    x_data = x_data[-max_points:]
+                if y_data.size > max_points:
+                    y_data = y_data[-max_points:]
+                data[i] = (x_data, y_data)
+        legacy = (time.perf_counter() - start) / packets * 1e6
+
+        store = TelemetryStore(parser.schema, capacity=max_points)
+        start = time.perf_counter()
+        for packet in stream:
+            store.append_packet(packet)
+            for x_key, y_key in graphs:
+                count = store.window(max_points)
+                x_data = store.view(x_key, count)
+                y_data = store.view(y_key, count)
+        ring = (time.perf_counter() - start) / packets * 1e6
+
+        print(f"{max_points:>5} points: np.append {legacy:7.2f} us/packet, shared ring buffer {ring:6.2f} us/packet")
+
+
+def run_pipeline_benchmark(secs=5.0, rate=0, malformed_rate=0.01):
+    # Simulator -> pty -> SerialCommThread -> CommsParser, with no radio or GUI involved
+    simulator = TelemetrySimulator(rate=rate, replay_file="test.txt", malformed_rate=malformed_rate)
+    comm_thread = sc.SerialCommThread(simulator.port, 256000, batch_interval=0.016)
+    parser = CommsParser.CommsParser(NAMES, EXPONENTS)
+    counts = {"packets": 0, "warnings": 0}
+
+    def on_parsed(batch):
+        counts["packets"] += len(batch)
+
+    def on_warning(*args):
+        counts["warnings"] += 1
+    comm_thread.signals.receive.connect(parser.parse, Qt.DirectConnection)
+    comm_thread.signals.receive_batch.connect(parser.parse_batch, Qt.DirectConnection)
+    parser.parsed_batch.connect(on_parsed, Qt.DirectConnection)
+    parser.warning.connect(on_warning, Qt.DirectConnection)
+    parser.malformed.connect(on_warning, Qt.DirectConnection)
+
+    runner = threading.Thread(target=comm_thread.run)
+    runner.start()
+    time.sleep(0.2)
+    simulator.start()
+    cpu_start = time.process_time()
+    time.sleep(secs)
+    cpu = (time.process_time() - cpu_start) / secs * 100
+    packets = counts["packets"]
+    comm_thread.close_port()
+    runner.join()
+    simulator.stop()
+
+    print(f"pipeline: {packets / secs:8.0f} packets/sec parsed, {counts['warnings']} malformed caught, "
+          f"{simulator.sent} sent, CPU {cpu:.0f}%")
+
+
+if __name__ == "__main__":
+    benchmarks = {"serial": run_serial_benchmarks,
+                  "framing": run_framing_benchmark,
+                  "parser": run_parser_benchmark,
+                  "log": run_log_benchmark,
+                  "graph": run_graph_benchmark,
+                  "pipeline": run_pipeline_benchmark}
+    for name in sys.argv[1:] or benchmarks.keys():
+        benchmarks[name]()
@@ -4,19 +4,34 @@ from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
+from CommsParser import field_index
+from TelemetryStore import StoreDisplay
 
-class GSGraph(QWidget):
 
-    def __init__(self, x_key, y_key, max_points=600, title="", x_units="", y_units=""):
+class GSGraph(QWidget, StoreDisplay):
+
+    def __init__(self, x_key, y_key, max_points=600, title="", x_units="", y_units="", schema=None, store=None,
+                 scheduler=None):
         super().__init__()
 
         self.x_data = np.array([])
         self.y_data = np.array([])
 
-        self.x_key = x_key
-        self.y_key = y_key
+        self.x_key = field_index(schema, x_key)
+        self.y_key = field_index(schema, y_key)
+
+        # Data comes from a TelemetryStore shared with the other displays
+        self.init_store(schema, store, max_points, scheduler, self.redraw)
+        # The whole session, drawn at whichever resolution gives about one bucket per pixel across
+        self.history = self.store.history(self.x_key, self.y_key)
 
-        self.max_points = max_points
+        # pyqtgraph's auto-range rescans every point on every setData, so the graph keeps its own running bounds and
+        # sets the axes itself until the user zooms or pans
+        self.auto_scale = True
+        self.x_range = AxisRange(margin=0)
+        self.y_range = AxisRange()
+        self.x_range.update(self.history.x[0][:len(self.history)])
+        self.y_range.update(self.history.low[0][:len(self.history)])
 
         self.init_ui(title, x_units, y_units)
 
@@ -29,6 +44,11 @@ class GSGraph(QWidget):
 
         self.plot_w = pg.PlotWidget()
         self.plot = self.plot_w.plot(self.x_data, self.y_data)
+        self.view_box = self.plot_w.getPlotItem().getViewBox()
+        self.view_box.disableAutoRange()
+        self.view_box.sigXRangeChanged.connect(self.on_x_range_changed)
+        self.view_box.sigRangeChangedManually.connect(self.on_range_changed_manually)
+        self.plot_w.getPlotItem().autoBtn.clicked.connect(self.on_auto_scale)
 
         self.clear_btn = QPushButton("CLR")
         f = QFont()
@@ -52,16 +72,101 @@ class GSGraph(QWidget):
         layout.addWidget(self.plot_w)
 
 
-    def update_plot(self, dictionary):
-        self.x_data = np.append(self.x_data, dictionary[self.x_key])
-        self.y_data = np.append(self.y_data, dictionary[self.y_key])
-        if self.x_data.size > self.max_points:
-            self.x_data = np.delete(self.x_data, 0)
-        if self.y_data.size > self.max_points:
-            self.y_data = np.delete(self.y_data, 0)
+    def update_plot(self, packet):
+        self.store_packet(packet)
+        self.x_range.include(packet[self.x_key])
+        self.y_range.include(packet[self.y_key])
+        self.schedule_redraw()
+
+    def update_batch(self, batch):
+        self.store_batch(batch)
+        self.x_range.update(batch[self.x_key])
+        self.y_range.update(batch[self.y_key])
+        self.schedule_redraw()
+
+    def on_x_range_changed(self):
+        # Zooming or panning by hand changes which samples are visible and how coarse they can be
+        if not self.auto_scale:
+            self.schedule_redraw()
+
+    def on_range_changed_manually(self):
+        self.auto_scale = False
+
+    def on_auto_scale(self):
+        # The "A" button turns pyqtgraph's own auto-range back on; take over from it again
+        self.view_box.disableAutoRange()
+        self.auto_scale = True
+        self.x_range.shown = self.y_range.shown = None
+        self.redraw()
+
+    def redraw(self):
+        self.x_data, self.y_data = visible_points(self.history, self.view_box, self.cleared_at, not self.auto_scale)
         self.plot.setData(self.x_data, self.y_data)
+        if self.auto_scale:
+            set_ranges(self.view_box, self.x_range, self.y_range)
 
     def clear_plot(self):
-        self.x_data = np.array([])
-        self.y_data = np.array([])
-        self.plot.setData(self.x_data, self.y_data)
+        self.cleared_at = self.store.total
+        self.x_range.reset()
+        self.y_range.reset()
+        self.redraw()
+
+
+class AxisRange:
+    """
+    Running bounds of one axis's data, and a shown range with `margin` of headroom that only moves when the data
+    leaves it or shrinks below `shrink` of it, so the axis doesn't twitch on every packet.
+    """
+
+    def __init__(self, margin=0.1, shrink=0.5):
+        self.margin = margin
+        self.shrink = shrink
+        self.reset()
+
+    def reset(self):
+        self.low = np.inf
+        self.high = -np.inf
+        self.shown = None
+
+    def update(self, values):
+        if len(values):
+            # fmin/fmax skip NaNs
+            self.low = np.fmin.reduce(values, initial=self.low)
+            self.high = np.fmax.reduce(values, initial=self.high)
+
+    def include(self, value):
+        self.low = np.fmin(self.low, value)
+        self.high = np.fmax(self.high, value)
+
+    def target(self):
+        # The range to show, or None before there's any data
+        if not self.low <= self.high:
+            return None
+        low, high = self.low, self.high
+        if self.shown is not None:
+            shown_low, shown_high = self.shown
+            if shown_low <= low and high <= shown_high and high - low >= self.shrink * (shown_high - shown_low):
+                return self.shown
+        span = high - low
+        if span == 0:
+            span = max(abs(high), 1.0)
+        self.shown = (low - self.margin * span, high + self.margin * span)
+        return self.shown
+
+
+def visible_points(history, view_box, cleared_at, zoomed):
+    # What of a MinMaxPyramid to draw in view_box: everything since cleared_at, or just the visible part once the x
+    # axis has been zoomed by hand, at about one bucket per pixel across
+    first = cleared_at - history.start
+    last = len(history)
+    if zoomed:
+        x_min, x_max = view_box.viewRange()[0]
+        first, last = history.window(x_min, x_max, first)
+    return history.points(first, last, max(int(view_box.width()), 100))
+
+
+def set_ranges(view_box, x_range, y_range):
+    x = x_range.target()
+    y = y_range.target()
+    if x is not None and y is not None:
+        view_box.setRange(xRange=x, yRange=y, padding=0)
@@ -1,16 +1,21 @@
 import sys
 
+from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
 import CommandWidget
 import CommsLog
 import CommsParser
+import DisplayQueue
 import GPSDisplay
 import GSGraph
 import ModelDisplay
+import RedrawScheduler
+import StackedGraph
 import SerialComms as sc
 import FileComms as fc
 import StateDisplay
+import TelemetryStore
 import dark_fusion
 from MoreCommandWidget import MoreCommandWidget
 from QTabWidgetResize import QTabWidgetResize
@@ -25,17 +30,33 @@ class Screen(QWidget):
         super().__init__()
         self.setWindowTitle("Astrotrain Ground Station")
 
-        self.comm_w = sc.SerialConnectionWidget()
+        self.comm_w = sc.SerialConnectionWidget(priority_commands=["ABORT", "STATE/4", "STATE/04"])
         self.file_w = fc.FileConnectionWidget()
-        self.parser = CommsParser.CommsParser(["team_id", "mission_time", "packet_count", "altitude", "pressure",
-                                               "temp", "voltage", "gps_time", "gps_latitude", "gps_longitude",
-                                               "gps_altitude", "gps_sats", "pitch", "roll", "blade_spin_rate",
-                                               "software_state", "bonus_direction"],
-                                              [0, -3, 0, -1, 0, -1, -2, 0, -5, -5, -1, 0, -1, -1, 0, "str", -1])
+        self.parser = CommsParser.CommsParser(CommsParser.PACKET_NAMES, CommsParser.PACKET_EXPONENTS,
+                                              sequence_key="packet_count")
+
+        # Parsing runs on its own thread. Parsed batches reach the displays through a bounded queue so a stalled UI
+        # drops display updates instead of backing up the parser; log output still gets every line.
+        self.parser_thread = QThread()
+        self.parser.moveToThread(self.parser_thread)
+        self.display_queue = DisplayQueue.DisplayQueue(max_depth=32, policy=DisplayQueue.DROP_OLDEST)
+        # Every display reads its data from this one store, which is filled once per drained batch
+        self.store = TelemetryStore.TelemetryStore(self.parser.schema)
+        self.display_queue.batch.connect(self.store.append)
+        # Graphs only mark themselves dirty when data arrives; this redraws the visible ones once per frame
+        self.scheduler = RedrawScheduler.RedrawScheduler()
+        self.parser.parsed_batch.connect(self.display_queue.put, Qt.DirectConnection)
+
+        # Received lines go straight from the comm threads to the parser thread without a stop on the GUI thread.
+        # A seek in the replay takes the same route so it lands between the batches from before and after it.
+        self.comm_w.set_parser(self.parser)
+        self.file_w.set_parser(self.parser)
+        # Still used for the echo of transmitted commands
         self.comm_w.received.connect(self.parser.parse)
-        self.file_w.received.connect(self.parser.parse)
+        self.parser.stream_reset.connect(self.display_queue.clear, Qt.DirectConnection)
+        self.display_queue.reset.connect(self.reset_displays)
         self.log_w = CommsLog.CommsLog()
-        self.parser.csv_headers.connect(self.log_w.set_headers)
+        self.log_w.connect_parser(self.parser)
         self.cmds = CommandWidget.CommandWidget({"Arm for launch": "ARM",
                                                  "Un-Arm": "STATE/0",
                                                  "Soft Reset": "RESET",
@@ -56,51 +77,44 @@ class Screen(QWidget):
                                                            "Say Hi to CanSat": "Hi CanSat, how are you?"})
 
         self.alt_plot = GSGraph.GSGraph("mission_time", "altitude",
-                                        title="Altitude", x_units="Seconds", y_units="Meters")
-        self.parser.parsed.connect(self.alt_plot.update_plot)
-
-        self.alt_plot2 = GSGraph.GSGraph("mission_time", "altitude",
-                                         title="Altitude", x_units="Seconds", y_units="Meters")
-        self.parser.parsed.connect(self.alt_plot2.update_plot)
-
-        self.pressure_plot = GSGraph.GSGraph("mission_time", "pressure",
-                                        title="Pressure", x_units="Seconds", y_units="Pascals")
-        self.parser.parsed.connect(self.pressure_plot.update_plot)
-
-        self.temp_plot = GSGraph.GSGraph("mission_time", "temp",
-                                        title="Temperature", x_units="Seconds", y_units="Celsius")
-        self.parser.parsed.connect(self.temp_plot.update_plot)
+                                        title="Altitude", x_units="Seconds", y_units="Meters",
+                                        schema=self.parser.schema, store=self.store,
+                                        scheduler=self.scheduler)
+        self.store.updated.connect(self.alt_plot.update_batch)
 
         self.volt_plot = GSGraph.GSGraph("mission_time", "voltage",
-                                        title="Power Bus Voltage", x_units="Seconds", y_units="Volts")
-        self.parser.parsed.connect(self.volt_plot.update_plot)
-
-        self.volt_plot2 = GSGraph.GSGraph("mission_time", "voltage",
-                                         title="Power Bus Voltage", x_units="Seconds", y_units="Volts")
-        self.parser.parsed.connect(self.volt_plot2.update_plot)
-
-        self.rpm_plot = GSGraph.GSGraph("mission_time", "blade_spin_rate",
-                                        title="Blade Spin Rate", x_units="Seconds", y_units="RPM")
-        self.parser.parsed.connect(self.rpm_plot.update_plot)
+                                        title="Power Bus Voltage", x_units="Seconds", y_units="Volts",
+                                        schema=self.parser.schema, store=self.store,
+                                        scheduler=self.scheduler)
+        self.store.updated.connect(self.volt_plot.update_batch)
 
         self.yaw_plot = GSGraph.GSGraph("mission_time", "bonus_direction",
-                                        title="Heading", x_units="Seconds", y_units="Degrees from North")
-        self.parser.parsed.connect(self.yaw_plot.update_plot)
-
-        self.yaw_plot2 = GSGraph.GSGraph("mission_time", "bonus_direction",
-                                        title="Heading", x_units="Seconds", y_units="Degrees from North")
-        self.parser.parsed.connect(self.yaw_plot2.update_plot)
-
-        self.pitch_plot = GSGraph.GSGraph("mission_time", "pitch",
-                                        title="Pitch", x_units="Seconds", y_units="Degrees")
-        self.parser.parsed.connect(self.pitch_plot.update_plot)
-
-        self.roll_plot = GSGraph.GSGraph("mission_time", "roll",
-                                          title="Roll", x_units="Seconds", y_units="Degrees")
-        self.parser.parsed.connect(self.roll_plot.update_plot)
-
-        self.state_disp = StateDisplay.StateDisplay("software_state", "mission_time", "gps_time", "packet_count")
-        self.parser.parsed.connect(self.state_disp.update_state)
+                                        title="Heading", x_units="Seconds", y_units="Degrees from North",
+                                        schema=self.parser.schema, store=self.store,
+                                        scheduler=self.scheduler)
+        self.store.updated.connect(self.yaw_plot.update_batch)
+
+        # The secondary tab is one stack of linked panes rather than a PlotWidget per channel
+        self.secondary_plot = StackedGraph.StackedGraph("mission_time", x_units="Seconds", columns=4,
+                                                        schema=self.parser.schema, store=self.store,
+                                                        scheduler=self.scheduler)
+        self.secondary_plot.add_channel("altitude", title="Altitude", y_units="Meters")
+        self.secondary_plot.add_channel("pressure", title="Pressure", y_units="Pascals")
+        self.secondary_plot.add_channel("temp", title="Temperature", y_units="Celsius")
+        self.secondary_plot.add_channel("voltage", title="Power Bus Voltage", y_units="Volts")
+        self.secondary_plot.add_channel("roll", title="Roll", y_units="Degrees")
+        self.secondary_plot.add_channel("pitch", title="Pitch", y_units="Degrees")
+        self.secondary_plot.add_channel("bonus_direction", title="Heading", y_units="Degrees from North")
+        self.secondary_plot.add_channel("blade_spin_rate", title="Blade Spin Rate", y_units="RPM")
+        self.store.updated.connect(self.secondary_plot.update_batch)
+
+        self.state_disp = StateDisplay.StateDisplay("software_state", "mission_time", "gps_time", "packet_count",
+                                                    schema=self.parser.schema)
+        self.display_queue.batch.connect(self.state_disp.update_batch)
+        self.parser.link_stats.connect(self.state_disp.update_link_stats)
+        self.parser.link_stats.connect(self.update_queue_stats)
+        self.parser_thread.started.connect(self.parser.start_stats)
+        self.parser_thread.finished.connect(self.parser.stop_stats, Qt.DirectConnection)
 
         if not huntsville:
             lat_min = 32.2345
@@ -118,20 +132,16 @@ class Screen(QWidget):
 
         self.gps_disp = GPSDisplay.GPSDisplay("gps_latitude", "gps_longitude", "altitude", "gps_sats",
                                               lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max,
-                                              image_name=image_name, max_points=600)
-        self.parser.parsed.connect(self.gps_disp.update_plot)
+                                              image_name=image_name, max_points=600, schema=self.parser.schema,
+                                              store=self.store, scheduler=self.scheduler)
+        self.store.updated.connect(self.gps_disp.update_batch)
 
         self.model_disp = ModelDisplay.ModelDisplay("gps_latitude", "gps_longitude", "altitude", "blade_spin_rate",
                                                     "software_state", "roll", "pitch", "bonus_direction",
                                                     lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max,
-                                                    image_name=image_name, max_points=600)
-        self.parser.parsed.connect(self.model_disp.update_plot)
-
-        self.parser.packet.connect(self.log_w.log_packet)
-        self.parser.message.connect(self.log_w.log_message)
-        self.parser.command.connect(self.log_w.log_command)
-        self.parser.error.connect(self.log_w.log_error)
-        self.parser.warning.connect(self.log_w.log_warning)
+                                                    image_name=image_name, max_points=600, schema=self.parser.schema,
+                                                    store=self.store)
+        self.store.updated.connect(self.model_disp.update_batch)
 
         self.cmds.command_sent.connect(self.comm_w.transmit)
         self.more_cmds.command_sent.connect(self.comm_w.transmit)
@@ -150,20 +160,9 @@ class Screen(QWidget):
         primary_graph_layout.addWidget(self.volt_plot, 1, 1)
         primary_graph_layout.addWidget(self.yaw_plot, 1, 2)
 
-        secondary_graph_holder = QWidget()
-        secondary_graph_layout = QGridLayout(secondary_graph_holder)
-        secondary_graph_layout.addWidget(self.alt_plot2, 0, 0)
-        secondary_graph_layout.addWidget(self.pressure_plot, 0, 1)
-        secondary_graph_layout.addWidget(self.temp_plot, 0, 2)
-        secondary_graph_layout.addWidget(self.volt_plot2, 0, 3)
-        secondary_graph_layout.addWidget(self.roll_plot, 1, 0)
-        secondary_graph_layout.addWidget(self.pitch_plot, 1, 1)
-        secondary_graph_layout.addWidget(self.yaw_plot2, 1, 2)
-        secondary_graph_layout.addWidget(self.rpm_plot, 1, 3)
-
         top_tabwidget = QTabWidgetResize()
         top_tabwidget.addTab(primary_graph_holder, "Primary Display")
-        top_tabwidget.addTab(secondary_graph_holder, "Secondary Display")
+        top_tabwidget.addTab(self.secondary_plot, "Secondary Display")
 
         clear_all_btn = QPushButton("Clear All Graphs")
         clear_all_btn.setParent(top_tabwidget)
@@ -174,14 +173,7 @@ class Screen(QWidget):
         clear_all_btn.clicked.connect(self.alt_plot.clear_plot)
         clear_all_btn.clicked.connect(self.volt_plot.clear_plot)
         clear_all_btn.clicked.connect(self.yaw_plot.clear_plot)
-        clear_all_btn.clicked.connect(self.alt_plot2.clear_plot)
-        clear_all_btn.clicked.connect(self.pressure_plot.clear_plot)
-        clear_all_btn.clicked.connect(self.temp_plot.clear_plot)
-        clear_all_btn.clicked.connect(self.volt_plot2.clear_plot)
-        clear_all_btn.clicked.connect(self.roll_plot.clear_plot)
-        clear_all_btn.clicked.connect(self.pitch_plot.clear_plot)
-        clear_all_btn.clicked.connect(self.yaw_plot2.clear_plot)
-        clear_all_btn.clicked.connect(self.rpm_plot.clear_plot)
+        clear_all_btn.clicked.connect(self.secondary_plot.clear_plot)
 
         botton_tabwidget = QTabWidget()
         botton_tabwidget.setMinimumWidth(450)
@@ -201,6 +193,25 @@ class Screen(QWidget):
         layout.addWidget(top_tabwidget)
         layout.addWidget(bottom_layout_holder)
 
+        self.parser_thread.start()
+
+    def update_queue_stats(self, link_stats):
+        # Shown alongside the link stats and on the same timer
+        self.state_disp.update_queue_stats(self.display_queue.stats())
+
+    def reset_displays(self):
+        self.store.clear()
+        for display in (self.alt_plot, self.volt_plot, self.yaw_plot, self.secondary_plot, self.gps_disp,
+                        self.model_disp):
+            display.clear_plot()
+
+    def closeEvent(self, event):
+        self.parser_thread.quit()
+        # File output goes to the writer from the parser thread, so once that has finished everything is queued
+        self.parser_thread.wait()
+        self.log_w.stop_writer()
+        super().closeEvent(event)
+
 
 def run():
     app = QApplication(sys.argv)
@@ -0,0 +1,127 @@
+import time
+
+
+class LineFramer:
+    """
+    Splits a byte stream into newline terminated frames using one reusable buffer. A partial line waits in the
+    buffer for the rest of it, and a line longer than the buffer is dropped whole.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.dropped = 0
+        # Set after an over-long line is thrown away, everything up to the next newline is the rest of it
+        self.skipping = False
+
+    def reset(self):
+        self.start = 0
+        self.end = 0
+        self.skipping = False
+
+    def feed(self, data):
+        size = len(data)
+        if self.end + size <= self.capacity and not self.skipping:
+            return self.feed_piece(data, size)
+
+        # A chunk bigger than the space left is taken a buffer's worth at a time, so the lines it completes or holds
+        # whole are kept and only a line longer than the whole buffer is lost
+        frames = []
+        position = 0
+        while position < size:
+            if self.skipping:
+                newline = data.find(b"\n", position)
+                if newline == -1:
+                    break
+                position = newline + 1
+                self.skipping = False
+                continue
+            if self.end + size - position > self.capacity:
+                self.compact()
+            if self.end == self.capacity:
+                self.dropped += 1
+                self.reset()
+                self.skipping = True
+                continue
+            piece = min(size - position, self.capacity - self.end)
+            frames += self.feed_piece(data[position:position + piece], piece)
+            position += piece
+        return frames
+
+    def feed_piece(self, data, size):
+        end = self.end + size
+        self.view[self.end:end] = data
+
+        last = self.buffer.rfind(b"\n", self.end, end)
+        if last == -1:
+            self.end = end
+            return []
+
+        # Everything up to the last newline is a run of complete frames. Decode that region straight out of the buffer
+        # in one call and split it in C rather than slicing and decoding frame by frame.
+        frames = str(self.view[self.start:last], "utf-8", "replace").split("\n")
+        for i, frame in enumerate(frames):
+            if frame and (frame[-1] <= " " or frame[0] <= " "):
+                frames[i] = frame.strip()
+        if "" in frames:
+            frames = [frame for frame in frames if frame]
+
+        self.start = last + 1
+        self.end = end
+        if self.start == end:
+            self.reset()
+        return frames
+
+    def finish(self):
+        # At the end of a file the last line may have no newline, hand it over rather than waiting for one
+        frame = str(self.view[self.start:self.end], "utf-8", "replace").strip()
+        self.reset()
+        return [frame] if frame else []
+
+    def compact(self):
+        remaining = self.end - self.start
+        if self.start > 0:
+            self.view[0:remaining] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = remaining
+
+
+class LineBatcher:
+    """
+    Collects frames for up to `interval` seconds and emits them as (lines, receive times). An interval of 0 emits
+    every frame on its own.
+    """
+
+    def __init__(self, interval, emit_line, emit_batch):
+        self.interval = interval
+        self.emit_line = emit_line
+        self.emit_batch = emit_batch
+        self.lines = []
+        self.times = []
+        self.started = 0
+
+    def add(self, lines):
+        if not self.interval:
+            for line in lines:
+                self.emit_line(line)
+            return
+        if not self.lines:
+            self.started = time.perf_counter()
+        self.lines.extend(lines)
+        self.times.extend([time.time()] * len(lines))
+        self.poll()
+
+    def poll(self):
+        if self.lines and time.perf_counter() - self.started >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            lines = self.lines
+            times = self.times
+            self.lines = []
+            self.times = []
+            self.emit_batch(lines, times)
@@ -0,0 +1,138 @@
+import collections
+
+import numpy as np
+
+# Slot states in the sequence window
+UNKNOWN, SEEN, MISSING = 0, 1, 2
+
+# Inter-arrival histogram bin edges in milliseconds, the last bin catches everything over two seconds
+JITTER_BINS_MS = np.array([0, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, np.inf])
+
+
+class LinkStats:
+    """
+    Running downlink statistics from packet_count and receive times: loss, duplicates, reordering, counter resets,
+    rate and jitter.
+    """
+
+    def __init__(self, window=1024, reorder_depth=32, rate_secs=5.0, ewma=1 / 16):
+        self.window = window
+        self.reorder_depth = min(reorder_depth, window - 1)
+        self.rate_secs = rate_secs
+        self.ewma = ewma
+        self.reset()
+
+    def reset(self):
+        self.first = None
+        self.highest = None
+        self.slots = np.zeros(self.window, dtype=np.int8)
+
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.gaps = 0
+        self.largest_gap = 0
+        self.resets = 0
+
+        self.last_time = None
+        self.jitter = 0.0
+        self.mean_interval = 0.0
+        self.histogram = np.zeros(len(JITTER_BINS_MS) - 1, dtype=np.int64)
+        self.arrivals = collections.deque()
+
+    def update(self, sequence, times):
+        for seq in sequence.astype(np.int64).tolist():
+            self.add_sequence(seq)
+        self.add_times(times)
+
+    def add_sequence(self, seq):
+        self.received += 1
+        if self.highest is None:
+            self.first = self.highest = seq
+            self.slots[seq % self.window] = SEEN
+            return
+
+        if seq > self.highest:
+            missing = seq - self.highest - 1
+            if missing:
+                self.lost += missing
+                self.gaps += 1
+                self.largest_gap = max(self.largest_gap, missing)
+            # Mark the slots we skipped over as missing, overwriting whatever the window is sliding past
+            if missing >= self.window:
+                self.slots[:] = MISSING
+            elif missing:
+                self.slots[np.arange(self.highest + 1, seq) % self.window] = MISSING
+            self.slots[seq % self.window] = SEEN
+            self.highest = seq
+        elif not self.is_reset(seq):
+            slot = self.slots[seq % self.window]
+            if slot == SEEN:
+                self.duplicates += 1
+            else:
+                self.out_of_order += 1
+                if slot == MISSING:
+                    self.lost -= 1
+                self.slots[seq % self.window] = SEEN
+        else:
+            self.resets += 1
+            self.first = self.highest = seq
+            self.slots[:] = UNKNOWN
+            self.slots[seq % self.window] = SEEN
+
+    def is_reset(self, seq):
+        behind = self.highest - seq
+        return behind > self.reorder_depth or (seq <= self.first and behind > 1)
+
+    def add_times(self, times):
+        if not len(times):
+            return
+        if self.last_time is not None:
+            deltas = np.diff(times, prepend=self.last_time) * 1000
+        else:
+            deltas = np.diff(times) * 1000
+        self.last_time = times[-1]
+
+        self.arrivals.append((self.last_time, len(times)))
+        while self.arrivals and self.arrivals[0][0] < self.last_time - self.rate_secs:
+            self.arrivals.popleft()
+
+        if not len(deltas):
+            return
+        bins = np.searchsorted(JITTER_BINS_MS, deltas, side="right") - 1
+        self.histogram += np.bincount(bins.clip(0, len(self.histogram) - 1), minlength=len(self.histogram))
+
+        # Packets in the same read share a timestamp, so only smooth over the gaps between reads
+        for delta in deltas[deltas > 0].tolist():
+            self.jitter += (abs(delta - self.mean_interval) - self.jitter) * self.ewma
+            self.mean_interval += (delta - self.mean_interval) * self.ewma
+
+    def packets_per_sec(self, now=None):
+        # Measured up to `now` when given, so the rate falls to zero when packets stop instead of holding its last value
+        if now is None:
+            now = self.last_time
+        recent = [(arrival, count) for arrival, count in self.arrivals if arrival >= now - self.rate_secs]
+        if not recent:
+            return 0.0
+        span = now - recent[0][0]
+        return (sum(count for arrival, count in recent) - recent[0][1]) / span if span > 0 else 0.0
+
+    def loss_rate(self):
+        expected = self.received - self.duplicates + self.lost
+        return self.lost / expected if expected > 0 else 0.0
+
+    def snapshot(self, now=None):
+        return {"received": self.received,
+                "packets_per_sec": float(self.packets_per_sec(now)),
+                "lost": self.lost,
+                "loss_rate": self.loss_rate(),
+                "duplicates": self.duplicates,
+                "out_of_order": self.out_of_order,
+                "gaps": self.gaps,
+                "largest_gap": self.largest_gap,
+                "resets": self.resets,
+                "last_sequence": self.highest,
+                "jitter_ms": float(self.jitter),
+                "mean_interval_ms": float(self.mean_interval),
+                "histogram_ms": list(zip(JITTER_BINS_MS[:-1].tolist(), self.histogram.tolist()))}
@@ -0,0 +1,182 @@
+import collections
+import os
+import queue
+import threading
+import time
+
+
+class LogWriter:
+    """
+    An append-mode log file kept open while logging, written out every flush_bytes or flush_interval seconds.
+    """
+
+    def __init__(self, path, flush_bytes=65536, flush_interval=1.0):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+
+        self.file = open(path, "a", encoding="utf-8")
+        self.is_empty = self.file.tell() == 0
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = time.perf_counter()
+
+        self.lines = 0
+        self.flushes = 0
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        self.pending.extend(lines)
+        self.pending_bytes += sum(map(len, lines)) + len(lines)
+        self.lines += len(lines)
+        self.is_empty = False
+        if self.pending_bytes >= self.flush_bytes or time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_line(self, text):
+        self.write_lines([text])
+
+    def poll(self):
+        if self.pending and time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.pending.append("")
+            self.file.write("\n".join(self.pending))
+            self.file.flush()
+            self.pending = []
+            self.pending_bytes = 0
+            self.flushes += 1
+        self.last_flush = time.perf_counter()
+
+    def sync(self):
+        self.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+class LogWriterThread(threading.Thread):
+    """
+    Does all log file I/O away from the GUI thread. write() never blocks: when the queue is full or the thread has
+    died, lines are dropped and counted. Files are fsynced every fsync_interval seconds.
+    """
+
+    def __init__(self, flush_bytes=65536, flush_interval=1.0, fsync_interval=5.0, max_queue=4096):
+        super().__init__(daemon=True)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(max_queue)
+        self.writers = {}
+        self.last_fsync = time.perf_counter()
+
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.backlog_high_water = 0
+        self.dropped_lines = 0
+        # Only the latest errors are kept; error_count has the total
+        self.errors = collections.deque(maxlen=16)
+        self.error_count = 0
+        self.last_error = None
+
+    def write(self, path, lines, header=None):
+        # The header only goes into a file that was empty when it was opened
+        self.put(("write", path, lines, header, time.perf_counter()), len(lines))
+
+    def write_batch(self, path, batch, open_writer):
+        # For binary logs; open_writer(path) makes the writer the first time this path is seen
+        self.put(("batch", path, batch, open_writer, time.perf_counter()), len(batch))
+
+    def close_files(self, timeout=10.0):
+        # Unlike lines, a close can't just be dropped or the files would go on being written after logging is turned off
+        self.put_control("close", timeout)
+
+    def stop(self, timeout=10.0):
+        if self.put_control("stop", timeout):
+            self.join(timeout)
+
+    def put_control(self, action, timeout):
+        if not self.is_alive():
+            return False
+        try:
+            self.queue.put((action, None, None, None, time.perf_counter()), timeout=timeout)
+        except queue.Full:
+            self.add_error(RuntimeError(f"log writer too far behind to {action} its files"))
+            return False
+        return True
+
+    def put(self, item, lines=0):
+        if not self.is_alive():
+            self.dropped_lines += lines
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_lines += lines
+            return
+        self.backlog_high_water = max(self.backlog_high_water, self.queue.qsize())
+
+    def add_error(self, e):
+        self.errors.append(e)
+        self.error_count += 1
+        self.last_error = time.perf_counter()
+
+    def stats(self):
+        return {"backlog": self.queue.qsize(),
+                "backlog_high_water": self.backlog_high_water,
+                "latency": self.latency,
+                "max_latency": self.max_latency,
+                "dropped_lines": self.dropped_lines,
+                "errors": self.error_count,
+                "alive": self.is_alive()}
+
+    def run(self):
+        while True:
+            try:
+                action, path, data, extra, queued_time = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                action = None
+
+            if action in ("close", "stop"):
+                for writer in self.writers.values():
+                    try:
+                        writer.close()
+                    except Exception as e:
+                        self.add_error(e)
+                self.writers = {}
+                if action == "stop":
+                    return
+
+            try:
+                if action == "write":
+                    writer = self.writers.get(path)
+                    if writer is None:
+                        writer = self.writers[path] = LogWriter(path, self.flush_bytes, self.flush_interval)
+                    if extra is not None and writer.is_empty:
+                        writer.write_line(extra)
+                    writer.write_lines(data)
+                elif action == "batch":
+                    writer = self.writers.get(path)
+                    if writer is None:
+                        writer = self.writers[path] = extra(path)
+                    writer.write_batch(data)
+
+                if action in ("write", "batch"):
+                    latency = time.perf_counter() - queued_time
+                    self.latency += (latency - self.latency) / 16
+                    self.max_latency = max(self.max_latency, latency)
+
+                for writer in self.writers.values():
+                    writer.poll()
+                if time.perf_counter() - self.last_fsync >= self.fsync_interval:
+                    self.last_fsync = time.perf_counter()
+                    for writer in self.writers.values():
+                        writer.sync()
+            except Exception as e:
+                # Keep going so a full or unplugged drive or one bad batch doesn't take the logging thread down with it
+                self.add_error(e)
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+class MinMaxPyramid:
+    """
+    The whole history of one channel against x at several resolutions, each level keeping the min and max of
+    `factor` buckets of the one below. `start` is the packet number of the first sample.
+    """
+
+    def __init__(self, factor=4, capacity=4096, start=0):
+        self.factor = factor
+        self.capacity = capacity
+        self.clear(start)
+
+    def __len__(self):
+        return self.lengths[0]
+
+    def clear(self, start=0):
+        self.start = start
+        x = np.zeros(self.capacity)
+        y = np.zeros(self.capacity)
+        # Level 0 has no buckets, so its low and high are the same array
+        self.x = [x]
+        self.low = [y]
+        self.high = [y]
+        self.lengths = [0]
+        # Samples where x went backwards, as mission_time does when the CanSat resets. x only goes up in between.
+        self.breaks = []
+
+    def extend(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        length = self.lengths[0]
+        if len(x):
+            previous = self.x[0][length - 1] if length else x[0]
+            self.breaks.extend((np.flatnonzero(np.diff(x, prepend=previous) < 0) + length).tolist())
+        self.write(0, x, np.asarray(y, dtype=np.float64), None)
+
+        level = 0
+        while self.lengths[level] >= self.factor:
+            if level + 1 == len(self.lengths):
+                self.add_level()
+            done = self.lengths[level + 1]
+            complete = self.lengths[level] // self.factor
+            if complete == done:
+                break
+            first, last = done * self.factor, complete * self.factor
+            # fmin/fmax skip NaNs, so one bad value doesn't blank out a bucket
+            low = np.fmin.reduce(self.low[level][first:last].reshape(-1, self.factor), axis=1)
+            high = np.fmax.reduce(self.high[level][first:last].reshape(-1, self.factor), axis=1)
+            self.write(level + 1, self.x[level][first:last:self.factor], low, high)
+            level += 1
+
+    def add_level(self):
+        size = max(len(self.x[-1]) // self.factor, 16)
+        self.x.append(np.zeros(size))
+        self.low.append(np.zeros(size))
+        self.high.append(np.zeros(size))
+        self.lengths.append(0)
+
+    def write(self, level, x, low, high):
+        length = self.lengths[level]
+        end = length + len(x)
+        if end > len(self.x[level]):
+            size = max(end, 2 * len(self.x[level]))
+            self.x[level] = grown(self.x[level], length, size)
+            self.low[level] = grown(self.low[level], length, size)
+            self.high[level] = self.low[level] if level == 0 else grown(self.high[level], length, size)
+        self.x[level][length:end] = x
+        self.low[level][length:end] = low
+        if level:
+            self.high[level][length:end] = high
+        self.lengths[level] = end
+
+    def level_for(self, samples, buckets):
+        # Coarsest level that still has at least `buckets` buckets across `samples` samples
+        level = 0
+        while samples // self.factor >= buckets and level + 1 < len(self.lengths):
+            samples //= self.factor
+            level += 1
+        return level
+
+    def points(self, first, last, buckets):
+        # x and y to draw samples first to last at about `buckets` buckets. Each bucket becomes a vertical line from its
+        # low to its high; bits at either end that don't fill a whole bucket come from the levels below.
+        first = max(first, 0)
+        last = min(last, self.lengths[0])
+        if last <= first:
+            return np.zeros(0), np.zeros(0)
+        parts = []
+        self.collect(self.level_for(last - first, buckets), first, last, parts)
+        return np.concatenate([x for x, y in parts]), np.concatenate([y for x, y in parts])
+
+    def collect(self, level, first, last, parts):
+        if first >= last:
+            return
+        if level == 0:
+            parts.append((self.x[0][first:last], self.low[0][first:last]))
+            return
+
+        span = self.factor ** level
+        bucket_first = -(-first // span)
+        bucket_last = min(last // span, self.lengths[level])
+        if bucket_last <= bucket_first:
+            self.collect(level - 1, first, last, parts)
+            return
+
+        self.collect(level - 1, first, bucket_first * span, parts)
+        x = self.x[level][bucket_first:bucket_last]
+        low = self.low[level][bucket_first:bucket_last]
+        high = self.high[level][bucket_first:bucket_last]
+        parts.append((np.repeat(x, 2), np.column_stack((low, high)).ravel()))
+        self.collect(level - 1, bucket_last * span, last, parts)
+
+    def runs(self, first, last):
+        # (start, end) of each run of samples between first and last where x only goes up
+        edges = [first] + [sample for sample in self.breaks if first < sample < last] + [last]
+        return zip(edges[:-1], edges[1:])
+
+    def window(self, x_min, x_max, first=0):
+        # Samples first to last that cover x_min to x_max, plus one either side so lines carry on past the edges. Each
+        # run is searched on its own, and the window spans every run that reaches into the range.
+        first = max(first, 0)
+        found = []
+        for start, end in self.runs(first, self.lengths[0]):
+            x = self.x[0][start:end]
+            if x[0] <= x_max and x[-1] >= x_min:
+                found.append((start + max(int(np.searchsorted(x, x_min)) - 1, 0),
+                              start + min(int(np.searchsorted(x, x_max)) + 1, len(x))))
+        if not found:
+            return first, first
+        return min(low for low, high in found), max(high for low, high in found)
+
+
+def grown(array, length, size):
+    new = np.zeros(size)
+    new[:length] = array[:length]
+    return new
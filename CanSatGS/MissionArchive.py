@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from CommsParser import TelemetryBatch, TelemetrySchema
+
+SCHEMA_FILE = "schema.json"
+TIME_FIELD = "receive_time"
+# Wide enough for any software_state, stored as UTF-8. Longer values are refused rather than cut short.
+STRING_DTYPE = "S32"
+
+
+def field_dtypes(schema):
+    # Numeric fields are kept already scaled, as float64. String fields are fixed width so they can be memory mapped too.
+    return {name: np.dtype("<f8") if multiplier is not None else np.dtype(STRING_DTYPE)
+            for name, multiplier in zip(schema.names, schema.multipliers)}
+
+
+def field_path(path, name):
+    return os.path.join(path, name + ".bin")
+
+
+class ArchiveWriter:
+    """
+    Appends parsed batches to a mission archive: a directory with one raw little-endian file per field, one for the
+    receive times and a schema.json.
+    """
+
+    def __init__(self, path, schema, chunk_rows=4096, flush_interval=1.0):
+        self.path = path
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.dtypes = field_dtypes(schema)
+
+        os.makedirs(path, exist_ok=True)
+        layout = {"names": schema.names, "exponents": schema.exponents,
+                  "dtypes": {name: dtype.str for name, dtype in self.dtypes.items()}, "time_field": TIME_FIELD}
+        schema_path = os.path.join(path, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            with open(schema_path, "r") as file:
+                if json.load(file) != layout:
+                    raise ValueError(f"{path} was written with a different packet layout")
+        else:
+            with open(schema_path, "w") as file:
+                json.dump(layout, file, indent=1)
+
+        self.files = {name: open(field_path(path, name), "ab") for name in schema.names + [TIME_FIELD]}
+        self.pending = []
+        self.pending_rows = 0
+        self.last_flush = time.perf_counter()
+        self.rows = 0
+
+    def write_batch(self, batch):
+        # Every column is encoded before anything is kept, so a batch that can't be stored is refused as a whole and the
+        # columns never end up different lengths
+        chunk = [self.column_bytes(name, batch[name]) for name in self.schema.names]
+        chunk.append(np.ascontiguousarray(batch.times, dtype="<f8").tobytes())
+        self.pending.append(chunk)
+        self.pending_rows += len(batch)
+        if self.pending_rows >= self.chunk_rows or time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def poll(self):
+        if self.pending and time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def column_bytes(self, name, column):
+        dtype = self.dtypes[name]
+        if dtype.kind != "S":
+            return np.ascontiguousarray(column, dtype=dtype).tobytes()
+        encoded = [str(value).encode("utf-8", "replace") for value in column]
+        for value in encoded:
+            if len(value) > dtype.itemsize:
+                raise ValueError(f"{name}={value!r} is longer than the archive's {dtype.itemsize} bytes")
+        return np.array(encoded, dtype=dtype).tobytes()
+
+    def flush(self):
+        if self.pending:
+            # Taken off the queue first so a failed write drops these rows instead of retrying them forever
+            pending = self.pending
+            rows = self.pending_rows
+            self.pending = []
+            self.pending_rows = 0
+            for i, name in enumerate(self.schema.names + [TIME_FIELD]):
+                self.files[name].write(b"".join(chunk[i] for chunk in pending))
+            for file in self.files.values():
+                file.flush()
+            self.rows += rows
+        self.last_flush = time.perf_counter()
+
+    def sync(self):
+        self.flush()
+        for file in self.files.values():
+            os.fsync(file.fileno())
+
+    def close(self):
+        self.sync()
+        for file in self.files.values():
+            file.close()
+
+
+class MissionArchive:
+    """
+    A mission archive opened with np.memmap. Columns are cut to the shortest, in case a chunk was only part written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE), "r") as file:
+            layout = json.load(file)
+        self.schema = TelemetrySchema(layout["names"], layout["exponents"])
+
+        dtypes = {name: np.dtype(dtype) for name, dtype in layout["dtypes"].items()}
+        dtypes[TIME_FIELD] = np.dtype("<f8")
+        sizes = {name: os.path.getsize(field_path(path, name)) // dtype.itemsize for name, dtype in dtypes.items()}
+        self.length = min(sizes.values())
+
+        self.columns = {}
+        for name, dtype in dtypes.items():
+            if self.length:
+                self.columns[name] = np.memmap(field_path(path, name), dtype=dtype, mode="r", shape=(self.length,))
+            else:
+                self.columns[name] = np.zeros(0, dtype=dtype)
+        self.times = self.columns.pop(TIME_FIELD)
+        self.column_list = [self.columns[name] for name in self.schema.names]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if type(key) is int:
+            return self.column_list[key]
+        return self.columns[key]
+
+    def to_batch(self, start=0, stop=None):
+        # Copies rows out of the map into an ordinary batch, rebuilding the raw packet text for the log
+        columns = {}
+        for name, multiplier in zip(self.schema.names, self.schema.multipliers):
+            column = self.columns[name][start:stop]
+            if multiplier is None:
+                column = np.char.decode(column, "utf-8", "replace").astype(object)
+            else:
+                column = np.array(column)
+            columns[name] = column
+        lines = self.packet_lines(columns)
+        return TelemetryBatch(self.schema, columns, lines, np.array(self.times[start:stop]))
+
+    def packet_lines(self, columns):
+        fields = []
+        for name, multiplier in zip(self.schema.names, self.schema.multipliers):
+            if multiplier is None:
+                fields.append(columns[name].tolist())
+            else:
+                fields.append(np.rint(columns[name] / multiplier).astype(np.int64).tolist())
+        return [",".join(map(str, values)) for values in zip(*fields)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Summarise a mission archive written by the ground station")
+    arg_parser.add_argument("archive", help="archive directory")
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    archive = MissionArchive(args.archive)
+    elapsed = time.perf_counter() - start
+    print(f"{len(archive)} packets, {len(archive.schema.names)} fields, opened in {elapsed * 1000:.1f} ms")
+    if len(archive):
+        print(f"received {time.ctime(archive.times[0])} to {time.ctime(archive.times[-1])}")
+        for name, multiplier in zip(archive.schema.names, archive.schema.multipliers):
+            if multiplier is not None:
+                column = archive[name]
+                print(f"  {name:>16}: min {column.min():12.5g}  max {column.max():12.5g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ from pyqtgraph import opengl
 from stl import mesh
 
 import GLViewWidgetFix
+from CommsParser import field_index
+from TelemetryStore import StoreDisplay
 
 
 def lerp_rot_signed(start_rot, end_rot, pct):
@@ -181,21 +183,21 @@ def rotate_inv_ypr(item, roll, pitch, yaw):
     item.applyTransform(transform, True)
 
 
-class ModelDisplay(QWidget):
+class ModelDisplay(QWidget, StoreDisplay):
 
-    def __init__(self, lat_key, lon_key, alt_key, blade_rate_key, state_key, roll_key, pitch_key, yaw_key, image_name="", lat_min=0, lat_max=0, lon_min=0, lon_max=0, max_points=50):
+    def __init__(self, lat_key, lon_key, alt_key, blade_rate_key, state_key, roll_key, pitch_key, yaw_key, image_name="", lat_min=0, lat_max=0, lon_min=0, lon_max=0, max_points=50, schema=None, store=None):
         super().__init__()
 
         self.image_name = image_name
 
-        self.lat_key = lat_key
-        self.lon_key = lon_key
-        self.alt_key = alt_key
-        self.blade_rate_key = blade_rate_key
-        self.state_key = state_key
-        self.roll_key = roll_key
-        self.pitch_key = pitch_key
-        self.yaw_key = yaw_key
+        self.lat_key = field_index(schema, lat_key)
+        self.lon_key = field_index(schema, lon_key)
+        self.alt_key = field_index(schema, alt_key)
+        self.blade_rate_key = field_index(schema, blade_rate_key)
+        self.state_key = field_index(schema, state_key)
+        self.roll_key = field_index(schema, roll_key)
+        self.pitch_key = field_index(schema, pitch_key)
+        self.yaw_key = field_index(schema, yaw_key)
 
         self.lat_min = lat_min
         self.lat_max = lat_max
@@ -249,6 +251,9 @@ class ModelDisplay(QWidget):
 
         self.max_points = max_points
 
+        # The trail is rebuilt from the shared TelemetryStore window each update instead of keeping its own copy
+        self.init_store(schema, store, max_points)
+
         self.meters_per_lat = 111000
         self.meters_per_lon = math.cos((lat_min+lat_max)*math.pi/360) * 111321
 
@@ -473,7 +478,26 @@ class ModelDisplay(QWidget):
             self.timer.setInterval(1000)
 
 
-    def update_plot(self, dictionary):
+    def update_plot(self, packet):
+        self.store_packet(packet)
+        self.update_model(packet)
+
+    def update_batch(self, batch):
+        # Older packets in the batch only extend the trail; the model pose is animated towards the newest one
+        self.store_batch(batch)
+        self.update_model(batch.packet(-1))
+
+    def update_points(self):
+        count = self.store.window(self.max_points, self.cleared_at)
+        lat = self.store.view(self.lat_key, count)
+        lon = self.store.view(self.lon_key, count)
+        alt = self.store.view(self.alt_key, count)
+        fixes = (lat != 0) & (lon != 0)
+        self.x_points = np.where(fixes, -(lat-(self.lat_min+self.lat_max)/2) * self.meters_per_lat, 0)
+        self.y_points = np.where(fixes, (lon-(self.lon_min+self.lon_max)/2) * self.meters_per_lon, 0)
+        self.z_points = np.where(fixes, np.maximum(alt, 0), alt)
+
+    def update_model(self, packet):
 
         dt = current_milli_time() - self.update_last_time
         self.update_old_dts.append(dt if dt < 2000 else 1000)
@@ -482,14 +506,14 @@ class ModelDisplay(QWidget):
             self.update_old_dts.pop(0)
         self.update_dt = mean(self.update_old_dts)
 
-        if dictionary[self.state_key] == "UNARMED":
+        if packet[self.state_key] == "UNARMED":
             self.rocket.hide()
             self.roc_detach = False
             self.can_detach = False
             self.blades_deployed = False
             self.chute_deployed = False
             self.blade_rate = 0
-        elif dictionary[self.state_key] == "PRELAUNCH":
+        elif packet[self.state_key] == "PRELAUNCH":
             self.nose.show()
             self.rocket.show()
             self.roc_detach = False
@@ -497,7 +521,7 @@ class ModelDisplay(QWidget):
             self.blades_deployed = False
             self.chute_deployed = False
             self.blade_rate = 0
-        elif dictionary[self.state_key] == "ASCENT":
+        elif packet[self.state_key] == "ASCENT":
             self.nose.show()
             self.rocket.show()
             self.roc_detach = False
@@ -505,7 +529,7 @@ class ModelDisplay(QWidget):
             self.blades_deployed = False
             self.chute_deployed = False
             self.blade_rate = 0
-        elif dictionary[self.state_key] == "DESCENT":
+        elif packet[self.state_key] == "DESCENT":
             self.nose.hide()
             self.rocket.show()
             self.roc_detach = True
@@ -513,14 +537,14 @@ class ModelDisplay(QWidget):
             self.blades_deployed = False
             self.chute_deployed = True
             self.blade_rate = 0
-        elif dictionary[self.state_key] == "ACTIVE":
+        elif packet[self.state_key] == "ACTIVE":
             self.nose.hide()
             self.rocket.show()
             self.roc_detach = True
             self.can_detach = True
             self.blades_deployed = True
             self.chute_deployed = True
-            self.blade_rate = dictionary[self.blade_rate_key] * 6
+            self.blade_rate = packet[self.blade_rate_key] * 6
         else:
             self.nose.hide()
             self.rocket.show()
@@ -536,29 +560,21 @@ class ModelDisplay(QWidget):
             self.chute.hide()
 
         self.last_sat_rot = self.sat_rot
-        self.sat_rot = [180-dictionary[self.yaw_key], dictionary[self.pitch_key], 360-dictionary[self.roll_key]]
+        self.sat_rot = [180-packet[self.yaw_key], packet[self.pitch_key], 360-packet[self.roll_key]]
 
         self.last_roc_rot = self.roc_rot
         if not self.roc_detach:
-            self.roc_rot = [-(180-dictionary[self.yaw_key]), -dictionary[self.pitch_key], (360-dictionary[self.roll_key])]
+            self.roc_rot = [-(180-packet[self.yaw_key]), -packet[self.pitch_key], (360-packet[self.roll_key])]
         else:
             self.roc_rot[:] = [x - (x * 0.25) for x in self.roc_rot]
 
         self.last_can_rot = self.can_rot
         if not self.can_detach:
-            self.can_rot = [180-dictionary[self.yaw_key], dictionary[self.pitch_key], 360-dictionary[self.roll_key]]
+            self.can_rot = [180-packet[self.yaw_key], packet[self.pitch_key], 360-packet[self.roll_key]]
         else:
             self.can_rot[:] = [x - (x * 0.25) for x in self.can_rot]
 
-        if dictionary[self.lat_key] != 0 and dictionary[self.lon_key] != 0:
-            self.x_points = np.append(self.x_points, -(dictionary[self.lat_key]-(self.lat_min+self.lat_max)/2) * self.meters_per_lat)
-            self.y_points = np.append(self.y_points, (dictionary[self.lon_key]-(self.lon_min+self.lon_max)/2) * self.meters_per_lon)
-            self.z_points = np.append(self.z_points, max(dictionary[self.alt_key],0))
-
-        else:
-            self.x_points = np.append(self.x_points, 0)
-            self.y_points = np.append(self.y_points, 0)
-            self.z_points = np.append(self.z_points, dictionary[self.alt_key])
+        self.update_points()
 
         positions = np.vstack([self.x_points, self.y_points, self.z_points + 0.73]).transpose()
         self.plot.setData(pos=positions)
@@ -581,13 +597,6 @@ class ModelDisplay(QWidget):
         self.last_sat_pos = self.sat_pos
         self.sat_pos = [self.x_points[-1], self.y_points[-1], max(self.z_points[-1], 0)]
 
-        if self.x_points.size > self.max_points:
-            self.x_points = np.delete(self.x_points, 0)
-        if self.y_points.size > self.max_points:
-            self.y_points = np.delete(self.y_points, 0)
-        if self.z_points.size > self.max_points:
-            self.z_points = np.delete(self.z_points, 0)
-
 
 
     def refresh(self):
@@ -658,6 +667,7 @@ class ModelDisplay(QWidget):
         self.curr_can_rot = rot
 
     def clear_plot(self):
+        self.cleared_at = self.store.total
         self.x_points = np.array([])
         self.y_points = np.array([])
         self.z_points = np.array([])
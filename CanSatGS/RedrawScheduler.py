@@ -0,0 +1,48 @@
+from PyQt5.QtCore import *
+
+
+class RedrawScheduler(QObject):
+    """
+    Redraws the visible widgets that called mark_dirty() at most once a frame. Hidden ones catch up when shown.
+    """
+
+    def __init__(self, frame_interval=16):
+        super().__init__()
+        self.redraws = {}
+        self.dirty = set()
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setInterval(frame_interval)
+        self.frame_timer.timeout.connect(self.render_frame)
+
+        self.frames = 0
+        self.redrawn = 0
+        self.skipped = 0
+
+    def register(self, widget, redraw):
+        self.redraws[widget] = redraw
+        widget.installEventFilter(self)
+
+    def mark_dirty(self, widget):
+        self.dirty.add(widget)
+        if not self.frame_timer.isActive():
+            self.frame_timer.start()
+
+    def render_frame(self):
+        self.frames += 1
+        for widget in list(self.dirty):
+            if widget.isVisible():
+                self.dirty.discard(widget)
+                self.redraws[widget]()
+                self.redrawn += 1
+            else:
+                self.skipped += 1
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Show and watched in self.dirty and not self.frame_timer.isActive():
+            self.frame_timer.start()
+        return False
+
+    def stats(self):
+        return {"frames": self.frames, "redrawn": self.redrawn, "skipped": self.skipped, "dirty": len(self.dirty)}
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+
+INDEX_SUFFIX = ".idx.npz"
+
+# mission_time, packet_count, altitude and software_state
+PACKET_FIELDS = (1, 2, 3, 15)
+
+
+def packet_values(line, fields=PACKET_FIELDS):
+    # The one rule for what counts as a packet, shared by the index and by playback so their packet numbers agree.
+    # Takes str or bytes and returns (mission_time, packet_count, altitude, software_state) or None.
+    time_field, count_field, altitude_field, state_field = fields
+    last_field = max(fields)
+    parts = line.split(b"," if type(line) is bytes else ",", last_field + 1)
+    if len(parts) <= last_field:
+        return None
+    try:
+        return float(parts[time_field]), float(parts[count_field]), float(parts[altitude_field]), parts[state_field]
+    except ValueError:
+        return None
+
+
+class ReplayIndex:
+    """
+    Offset, mission_time, packet_count and altitude of every packet in a raw log, plus state change events, cached
+    next to the log as <log>.idx.npz. Building it reads the whole file, so do it off the GUI thread.
+    """
+
+    def __init__(self, filename, fields=PACKET_FIELDS, time_scale=0.001, altitude_scale=0.1, progress=None):
+        self.filename = filename
+        self.fields = tuple(fields)
+        self.time_scale = time_scale
+        self.altitude_scale = altitude_scale
+
+        if not self.load():
+            self.build(progress)
+            self.save()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def source_stamp(self):
+        stat = os.stat(self.filename)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def load(self):
+        try:
+            with np.load(self.filename + INDEX_SUFFIX) as cached:
+                if not np.array_equal(cached["stamp"], self.source_stamp()) or \
+                        not np.array_equal(cached["fields"], self.fields):
+                    return False
+                self.offsets = cached["offsets"]
+                self.mission_time = cached["mission_time"]
+                self.packet_count = cached["packet_count"]
+                self.altitude = cached["altitude"]
+                self.event_index = cached["event_index"]
+                self.event_state = cached["event_state"]
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def save(self):
+        try:
+            with open(self.filename + INDEX_SUFFIX, "wb") as file:
+                np.savez(file, stamp=self.source_stamp(), fields=np.array(self.fields), offsets=self.offsets,
+                         mission_time=self.mission_time, packet_count=self.packet_count, altitude=self.altitude,
+                         event_index=self.event_index, event_state=self.event_state)
+        except OSError:
+            # A read-only log directory just means the index gets rebuilt next time
+            pass
+
+    def build(self, progress=None, chunk_size=1 << 20):
+        offsets = []
+        times = []
+        counts = []
+        altitudes = []
+        event_index = []
+        event_state = []
+        state = None
+
+        size = os.path.getsize(self.filename)
+        with open(self.filename, "rb") as file:
+            start = 0
+            carry = b""
+            while True:
+                chunk = file.read(chunk_size)
+                data = carry + chunk
+                if chunk:
+                    # Only whole lines are indexed; the partial one at the end waits for the next chunk
+                    end = data.rfind(b"\n") + 1
+                    data, carry = data[:end], data[end:]
+                offset = start
+                for line in data.split(b"\n"):
+                    values = packet_values(line, self.fields)
+                    if values is not None:
+                        offsets.append(offset)
+                        times.append(values[0])
+                        counts.append(values[1])
+                        altitudes.append(values[2])
+                        if values[3] != state:
+                            state = values[3]
+                            event_index.append(len(offsets) - 1)
+                            event_state.append(state.decode("utf-8", "replace").strip())
+                    offset += len(line) + 1
+                start += len(data)
+                if progress is not None and size:
+                    progress(min(start / size, 1.0))
+                if not chunk:
+                    break
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.mission_time = np.array(times, dtype=np.float64) * self.time_scale
+        self.packet_count = np.array(counts, dtype=np.int64)
+        self.altitude = np.array(altitudes, dtype=np.float64) * self.altitude_scale
+        self.event_index = np.array(event_index, dtype=np.int64)
+        self.event_state = np.array(event_state, dtype=str)
+
+    def events(self):
+        # (label, packet index) pairs for the jump list
+        events = [(f"{state} (T+{self.mission_time[i]:.1f} s)", int(i))
+                  for i, state in zip(self.event_index.tolist(), self.event_state.tolist())]
+        if len(self.altitude):
+            apogee = int(np.argmax(self.altitude))
+            events.append((f"Apogee {self.altitude[apogee]:.0f} m (T+{self.mission_time[apogee]:.1f} s)", apogee))
+            events.sort(key=lambda event: event[1])
+        return events
+
+    def index_of_offset(self, offset):
+        return max(int(np.searchsorted(self.offsets, offset, side="right")) - 1, 0)
+
+    def window_start(self, index, packets):
+        # Offset to start warming the displays up from, `packets` before the seek point
+        return int(self.offsets[max(index - packets, 0)]) if len(self.offsets) else 0
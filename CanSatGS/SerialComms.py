@@ -1,11 +1,21 @@
+import itertools
+import os
 import queue
 import time
+from collections import deque
 
 import serial
 import serial.tools.list_ports
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
+from LineFramer import LineBatcher, LineFramer
+
+if os.name == "posix":
+    from TelemetrySimulator import TelemetrySimulator
+else:
+    TelemetrySimulator = None
+
 
 def list_ports():
     return serial.tools.list_ports.comports()
@@ -16,14 +26,23 @@ class SerialConnectionWidget(QWidget):
     opened = pyqtSignal()
     closed = pyqtSignal()
     received = pyqtSignal(str)
+    received_batch = pyqtSignal(list, list)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, batch_interval=0.016, priority_commands=(), **kwargs):
         super().__init__(*args, **kwargs)
         self.threadpool = QThreadPool()
+        # The reader and writer each hold a pool thread for as long as the port is open
+        self.threadpool.setMaxThreadCount(max(self.threadpool.maxThreadCount(), 2))
         self.port = ""
         self.baud = 0
         self.timeout = 1
+        self.batch_interval = batch_interval
+        self.priority_commands = priority_commands
         self.comm_thread = None
+        self.parser = None
+        self.simulator = None
+
+        self.tx_latencies = deque(maxlen=50)
 
         self.init_ui()
 
@@ -59,6 +78,14 @@ class SerialConnectionWidget(QWidget):
         self.timeout_box.setText("1")
         self.timeout_box.textChanged.connect(self.set_timeout)
 
+        batch_label = QLabel("Batch (s)")
+        batch_label.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
+
+        self.batch_box = QLineEdit()
+        self.batch_box.setText(str(self.batch_interval))
+        self.batch_box.setToolTip("Lines received within this window are delivered together (0 for one at a time)")
+        self.batch_box.textChanged.connect(self.set_batch_interval)
+
         subwidget = QWidget()
         sublayout = QHBoxLayout(subwidget)
         sublayout.setContentsMargins(0, 0, 0, 0)
@@ -71,8 +98,14 @@ class SerialConnectionWidget(QWidget):
         self.close_button.clicked.connect(self.refresh_ports)
         self.close_button.setEnabled(False)
 
+        self.sim_button = QPushButton("Start Simulator")
+        self.sim_button.setToolTip("Stream simulated telemetry from a local pseudo-terminal")
+        self.sim_button.clicked.connect(self.toggle_simulator)
+        self.sim_button.setVisible(TelemetrySimulator is not None)
+
         sublayout.addWidget(self.open_button)
         sublayout.addWidget(self.close_button)
+        sublayout.addWidget(self.sim_button)
 
         layout.addWidget(port_label, 0, 0)
         layout.addWidget(self.port_list, 0, 1)
@@ -81,13 +114,17 @@ class SerialConnectionWidget(QWidget):
         layout.addWidget(self.baud_list, 1, 1, 1, 2)
         layout.addWidget(timeout_label, 2, 0)
         layout.addWidget(self.timeout_box, 2, 1, 1, 2)
-        layout.addWidget(subwidget, 3, 0, 1, 3)
+        layout.addWidget(batch_label, 3, 0)
+        layout.addWidget(self.batch_box, 3, 1, 1, 2)
+        layout.addWidget(subwidget, 4, 0, 1, 3)
 
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
 
     def refresh_ports(self):
         self.port_list.clear()
         self.port_list.addItems([row[0] for row in list_ports()])
+        if self.simulator is not None:
+            self.port_list.addItem(self.simulator.port)
         self.port_list.setCurrentIndex(self.port_list.count()-1)
 
     def set_port(self, port):
@@ -111,50 +148,101 @@ class SerialConnectionWidget(QWidget):
             self.timeout = 1
         print("Timeout changed to " + str(self.timeout))
 
+    def set_batch_interval(self, interval):
+        try:
+            self.batch_interval = max(float(interval), 0)
+        except:
+            self.batch_interval = 0
+        print("Batch interval changed to " + str(self.batch_interval))
+
+    def toggle_simulator(self):
+        if self.simulator is None:
+            self.simulator = TelemetrySimulator()
+            self.simulator.start()
+            self.sim_button.setText("Stop Simulator")
+            print("Simulating on " + self.simulator.port)
+        else:
+            self.simulator.stop()
+            self.simulator = None
+            self.sim_button.setText("Start Simulator")
+        self.refresh_ports()
+
     def set_edit_state(self, editable):
         self.refresh_btn.setEnabled(editable)
         self.port_list.setEnabled(editable)
         self.baud_list.setEnabled(editable)
         self.timeout_box.setEnabled(editable)
+        self.batch_box.setEnabled(editable)
         self.open_button.setEnabled(editable)
+        self.sim_button.setEnabled(editable)
         self.close_button.setEnabled(not editable)
 
 
     def open_port(self):
         print("Opening Port")
-        self.comm_thread = SerialCommThread(self.port, self.baud, timeout=self.timeout)
-        self.comm_thread.signals.receive.connect(self.on_receive)
+        self.comm_thread = SerialCommThread(self.port, self.baud, timeout=self.timeout,
+                                            batch_interval=self.batch_interval,
+                                            priority_commands=self.priority_commands)
+        for signal, slot in self.thread_connections():
+            signal.connect(slot)
         self.threadpool.start(self.comm_thread)
+        self.threadpool.start(self.comm_thread.writer)
 
         self.opened.emit()
         self.set_edit_state(False)
 
     def close_port(self):
         print("Closing Port")
-        self.comm_thread.signals.receive.disconnect(self.on_receive)
+        for signal, slot in self.thread_connections():
+            signal.disconnect(slot)
         self.comm_thread.close_port()
 
         self.closed.emit()
         self.set_edit_state(True)
 
+    def set_parser(self, parser):
+        # With a parser set, received lines go from the comm thread straight to the parser's thread rather than being
+        # passed on by the GUI thread
+        self.parser = parser
+
+    def thread_connections(self):
+        receive, receive_batch = self.on_receive, self.on_receive_batch
+        if self.parser is not None:
+            receive, receive_batch = self.parser.parse, self.parser.parse_batch
+        signals = self.comm_thread.signals
+        return [(signals.receive, receive), (signals.receive_batch, receive_batch),
+                (signals.transmitted, self.on_transmitted)]
+
     def on_receive(self, text):
-        self.received.emit(text.strip())
+        # Frames arrive already stripped and decoded by the LineFramer
+        self.received.emit(text)
+
+    def on_receive_batch(self, lines, times):
+        self.received_batch.emit(lines, times)
+
+    def on_transmitted(self, text, latency):
+        # Echo once the bytes have actually been written, along with how long the command waited to get out
+        self.tx_latencies.append(latency)
+        average = sum(self.tx_latencies) / len(self.tx_latencies)
+        self.received.emit(f"CMD TX: {text.strip()} [{latency * 1000:.1f} ms, avg {average * 1000:.1f} ms, "
+                           f"max {max(self.tx_latencies) * 1000:.1f} ms]")
 
     def transmit(self, text):
         text = str(text)
         if self.comm_thread is not None:
             self.comm_thread.transmit(text.encode("utf-8"))
-            self.received.emit("CMD TX: "+text.strip())
 
 
 class SerialThreadSignals(QObject):
     receive = pyqtSignal(str)
+    receive_batch = pyqtSignal(list, list)
+    transmitted = pyqtSignal(str, float)
 
 
 class SerialCommThread(QRunnable):
 
     def __init__(self, port, baud, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS,
-                 timeout=1):
+                 timeout=1, batch_interval=0, priority_commands=()):
         super().__init__()
 
         self.ser = serial.Serial()
@@ -163,11 +251,20 @@ class SerialCommThread(QRunnable):
         self.ser.parity = parity
         self.ser.stopbits = stopbits
         self.ser.bytesize = bytesize
-        self.ser.timeout = timeout
+        # Wake up at least once per batch window so a partly filled batch isn't held back until the next byte arrives
+        self.ser.timeout = min(timeout, batch_interval) if batch_interval else timeout
 
         self.signals = SerialThreadSignals()
 
-        self.tx_queue = queue.Queue()
+        # Entries are (priority, sequence, queued time, data). Priority commands sort ahead of everything else and the
+        # sequence number keeps the rest in the order they were sent.
+        self.tx_queue = queue.PriorityQueue()
+        self.tx_sequence = itertools.count()
+        self.priority_commands = set(priority_commands)
+        self.writer = SerialWriterThread(self)
+
+        self.framer = LineFramer()
+        self.batcher = LineBatcher(batch_interval, self.signals.receive.emit, self.signals.receive_batch.emit)
 
         self.close_flag = False
 
@@ -183,17 +280,20 @@ class SerialCommThread(QRunnable):
                 else:
                     self.signals.receive.emit("Connected")
                 num_tries = max_tries
+                self.framer.reset()
                 while self.ser.is_open:
 
-                    while self.ser.in_waiting > 0:
-                        self.signals.receive.emit(self.ser.readline().decode("utf-8"))
-
-                    if not self.tx_queue.empty():
-                        self.ser.write(self.tx_queue.get())
+                    # Blocks until at least one byte arrives, the port timeout expires or cancel_read() is called
+                    # by close_port(), then picks up whatever else is already buffered in the same call.
+                    data = self.ser.read(self.ser.in_waiting or 1)
+                    if data:
+                        self.batcher.add(self.framer.feed(data))
+                    self.batcher.poll()
 
                     if self.close_flag:
                         self.ser.close()
             except:
+                self.batcher.flush()
                 if num_tries < max_tries:
                     self.signals.receive.emit("Retry failed")
                 else:
@@ -203,13 +303,59 @@ class SerialCommThread(QRunnable):
                     self.ser.close()
                 except:
                     pass
+            self.batcher.flush()
             num_tries -= 1
             time.sleep(0.5)
+        self.writer.stop()
         self.signals.receive.emit("Too many retries (Close and reopen port to reset)")
 
 
     def transmit(self, data):
-        self.tx_queue.put(data)
+        priority = 0 if data.strip().decode("utf-8", "replace") in self.priority_commands else 1
+        self.tx_queue.put((priority, next(self.tx_sequence), time.perf_counter(), data))
 
     def close_port(self):
         self.close_flag = True
+        self.writer.stop()
+        self.wake()
+
+    def wake(self):
+        try:
+            self.ser.cancel_read()
+        except:
+            pass
+
+
+class SerialWriterThread(QRunnable):
+
+    def __init__(self, comm_thread):
+        super().__init__()
+
+        self.comm_thread = comm_thread
+        self.ser = comm_thread.ser
+        self.tx_queue = comm_thread.tx_queue
+        self.signals = comm_thread.signals
+
+    @pyqtSlot()
+    def run(self):
+        while True:
+            priority, sequence, queued_time, data = self.tx_queue.get()
+            if data is None:
+                break
+
+            # pyserial is happy to write from one thread while another is blocked in read(). If the reader is in the
+            # middle of reconnecting, hold on to the command until the port comes back.
+            while not self.comm_thread.close_flag:
+                try:
+                    self.ser.write(data)
+                    break
+                except:
+                    time.sleep(0.05)
+            else:
+                break
+
+            self.signals.transmitted.emit(data.decode("utf-8", "replace"), time.perf_counter() - queued_time)
+
+    def stop(self):
+        # Sorts ahead of every queued command so the writer exits straight away
+        self.tx_queue.put((-1, -1, 0, None))
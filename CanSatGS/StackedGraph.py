@@ -0,0 +1,144 @@
+import pyqtgraph as pg
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from PyQt5.QtWidgets import *
+
+from CommsParser import field_index
+from GSGraph import AxisRange, set_ranges, visible_points
+from TelemetryStore import StoreDisplay
+
+
+class StackedGraph(QWidget, StoreDisplay):
+    """
+    Several channels against one x axis, as linked PlotItems in one GraphicsLayoutWidget, redrawn together.
+    """
+
+    def __init__(self, x_key, x_units="", columns=1, schema=None, store=None, scheduler=None):
+        super().__init__()
+
+        self.schema = schema
+        self.x_key = field_index(schema, x_key)
+        self.x_units = x_units
+        self.columns = columns
+
+        self.init_store(schema, store, scheduler=scheduler, redraw=self.redraw)
+
+        self.panes = []
+        # (pane, curve, history, y_key) for every channel
+        self.channels = []
+
+        # Axes are scaled from running bounds, as in GSGraph: one x range for the stack and a y range per pane
+        self.auto_scale = True
+        self.x_range = AxisRange(margin=0)
+        self.y_ranges = []
+
+        self.init_ui()
+
+    def init_ui(self):
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        layout = QGridLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.layout_w = pg.GraphicsLayoutWidget()
+
+        self.clear_btn = QPushButton("CLR")
+        f = QFont()
+        f.setPointSize(8)
+        self.clear_btn.setFont(f)
+        self.clear_btn.setFixedSize(22, 22)
+        self.clear_btn.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.clear_btn.setAttribute(Qt.WA_NoSystemBackground, True)
+        self.clear_btn.setStyleSheet("QPushButton{background: transparent;}")
+        self.clear_btn.setToolTip("Clear Data")
+        self.clear_btn.setParent(self.layout_w)
+        self.clear_btn.clicked.connect(self.clear_plot)
+
+        layout.addWidget(self.layout_w)
+
+    def add_channel(self, y_key, title="", y_units="", pane=None):
+        # Adds a pane for the channel, or just a curve on an existing pane when given its index. Returns the pane index.
+        if pane is None:
+            pane = self.add_pane(title, y_units)
+        plot_item = self.panes[pane]
+        sharing = sum(1 for channel in self.channels if channel[0] == pane)
+        curve = plot_item.plot(pen=pg.intColor(sharing)) if sharing else plot_item.plot()
+        y_key = field_index(self.schema, y_key)
+        history = self.store.history(self.x_key, y_key)
+        self.channels.append((pane, curve, history, y_key))
+        self.x_range.update(history.x[0][:len(history)])
+        self.y_ranges[pane].update(history.low[0][:len(history)])
+        return pane
+
+    def add_pane(self, title, y_units):
+        index = len(self.panes)
+        plot_item = self.layout_w.addPlot(row=index // self.columns, col=index % self.columns)
+        if title:
+            plot_item.setTitle(title)
+        if y_units:
+            plot_item.setLabels(left=y_units)
+        if self.x_units:
+            plot_item.setLabels(bottom=self.x_units)
+
+        view_box = plot_item.getViewBox()
+        view_box.disableAutoRange()
+        view_box.sigRangeChangedManually.connect(self.on_range_changed_manually)
+        plot_item.autoBtn.clicked.connect(self.on_auto_scale)
+        if self.panes:
+            plot_item.setXLink(self.panes[0])
+        else:
+            view_box.sigXRangeChanged.connect(self.on_x_range_changed)
+        self.panes.append(plot_item)
+        self.y_ranges.append(AxisRange())
+        self.update_x_axes()
+        return index
+
+    def update_x_axes(self):
+        # The panes are x-linked, so only the bottom one in each column needs an x axis and label
+        for index, plot_item in enumerate(self.panes):
+            plot_item.showAxis("bottom", index + self.columns >= len(self.panes))
+
+    def update_plot(self, packet):
+        self.store_packet(packet)
+        self.x_range.include(packet[self.x_key])
+        for pane, curve, history, y_key in self.channels:
+            self.y_ranges[pane].include(packet[y_key])
+        self.schedule_redraw()
+
+    def update_batch(self, batch):
+        self.store_batch(batch)
+        self.x_range.update(batch[self.x_key])
+        for pane, curve, history, y_key in self.channels:
+            self.y_ranges[pane].update(batch[y_key])
+        self.schedule_redraw()
+
+    def on_x_range_changed(self):
+        if not self.auto_scale:
+            self.schedule_redraw()
+
+    def on_range_changed_manually(self):
+        self.auto_scale = False
+
+    def on_auto_scale(self):
+        for plot_item in self.panes:
+            plot_item.getViewBox().disableAutoRange()
+        self.auto_scale = True
+        for axis_range in [self.x_range] + self.y_ranges:
+            axis_range.shown = None
+        self.redraw()
+
+    def redraw(self):
+        if not self.panes:
+            return
+        view_box = self.panes[0].getViewBox()
+        for pane, curve, history, y_key in self.channels:
+            curve.setData(*visible_points(history, view_box, self.cleared_at, not self.auto_scale))
+        if self.auto_scale:
+            for plot_item, y_range in zip(self.panes, self.y_ranges):
+                set_ranges(plot_item.getViewBox(), self.x_range, y_range)
+
+    def clear_plot(self):
+        self.cleared_at = self.store.total
+        for axis_range in [self.x_range] + self.y_ranges:
+            axis_range.reset()
+        self.redraw()
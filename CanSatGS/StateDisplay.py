@@ -2,16 +2,18 @@ from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
+from CommsParser import field_index
+
 
 class StateDisplay(QWidget):
 
-    def __init__(self, state_key, met_key, utc_key, packet_key):
+    def __init__(self, state_key, met_key, utc_key, packet_key, schema=None):
         super().__init__()
 
-        self.state_key = state_key
-        self.met_key = met_key
-        self.utc_key = utc_key
-        self.packet_key = packet_key
+        self.state_key = field_index(schema, state_key)
+        self.met_key = field_index(schema, met_key)
+        self.utc_key = field_index(schema, utc_key)
+        self.packet_key = field_index(schema, packet_key)
 
         self.init_ui()
 
@@ -34,6 +36,14 @@ class StateDisplay(QWidget):
         self.packet_box.setReadOnly(True)
         self.packet_box.setAlignment(Qt.AlignCenter)
 
+        self.link_box = QLineEdit()
+        self.link_box.setReadOnly(True)
+        self.link_box.setAlignment(Qt.AlignCenter)
+
+        self.queue_box = QLineEdit()
+        self.queue_box.setReadOnly(True)
+        self.queue_box.setAlignment(Qt.AlignCenter)
+
         self.utc_box = QLCDNumber()
         self.utc_box.setDigitCount(8)
         self.utc_box.display("00:00:00")
@@ -45,25 +55,50 @@ class StateDisplay(QWidget):
         layout.addWidget(QLabel("Packets:"), 3, 0)
         layout.addWidget(QLabel("MET:"), 1, 0)
         layout.addWidget(QLabel("UTC:"), 2, 0)
+        layout.addWidget(QLabel("Link:"), 4, 0)
+        layout.addWidget(QLabel("Display:"), 5, 0)
 
         layout.addWidget(self.state_box, 0, 1)
         layout.addWidget(self.packet_box, 3, 1)
         layout.addWidget(self.met_box, 1, 1)
         layout.addWidget(self.utc_box, 2, 1)
+        layout.addWidget(self.link_box, 4, 1)
+        layout.addWidget(self.queue_box, 5, 1)
+
+    def update_batch(self, batch):
+        # Only the newest packet is visible, so there's no point drawing the ones before it
+        self.update_state(batch.packet(-1))
+
+    def update_link_stats(self, stats):
+        self.link_box.setText(f"{stats['packets_per_sec']:.1f} pkt/s, {stats['loss_rate'] * 100:.1f}% lost")
+        histogram = ", ".join(f">{edge:g} ms: {count}" for edge, count in stats["histogram_ms"] if count)
+        self.link_box.setToolTip(f"Received: {stats['received']}\n"
+                                 f"Lost: {stats['lost']} in {stats['gaps']} gaps (largest {stats['largest_gap']})\n"
+                                 f"Duplicates: {stats['duplicates']}\n"
+                                 f"Out of order: {stats['out_of_order']}\n"
+                                 f"Counter resets: {stats['resets']}\n"
+                                 f"Jitter: {stats['jitter_ms']:.1f} ms (mean interval {stats['mean_interval_ms']:.1f} ms)\n"
+                                 f"Inter-arrival: {histogram}")
+
+    def update_queue_stats(self, stats):
+        self.queue_box.setText(f"Queue {stats['depth']} (max {stats['depth_high_water']}), "
+                               f"{stats['dropped_packets']} pkts dropped")
+        self.queue_box.setToolTip(f"Dropped batches: {stats['dropped_batches']}\n"
+                                  f"Coalesced batches: {stats['coalesced']}")
 
-    def update_state(self, dictionary):
-        self.state_box.setText(dictionary[self.state_key])
+    def update_state(self, packet):
+        self.state_box.setText(packet[self.state_key])
 
-        self.packet_box.setText(str(int(dictionary[self.packet_key])))
+        self.packet_box.setText(str(int(packet[self.packet_key])))
 
-        utc_time = int(dictionary[self.utc_key])
+        utc_time = int(packet[self.utc_key])
         utc_seconds = str(int(utc_time % 60)).zfill(2)
         utc_minutes = str(int((int(utc_time/60)) % 60)).zfill(2)
         utc_hours = str(int((utc_time/60)/60)).zfill(2)
         utc_text = utc_hours+":"+utc_minutes+":"+utc_seconds
         self.utc_box.display(utc_text)
 
-        met_time = dictionary[self.met_key]
+        met_time = packet[self.met_key]
         met_seconds = str(int(met_time % 60)).zfill(2)
         met_minutes = str(int((int(met_time/60)) % 60)).zfill(2)
         met_hours = str(int((met_time/60)/60)).zfill(2)
@@ -0,0 +1,211 @@
+import argparse
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+
+def synthesize_packet(team_id, packet_count, t):
+    # Rough flight profile: sit on the pad, boost to ~700 m, fall under the container chute, then spin the blades for
+    # the last 450 m down. Values are pre-scaled to match the exponents the ground station expects.
+    if t < 5:
+        state, altitude = "PRELAUNCH", 0.0
+    elif t < 15:
+        state, altitude = "ASCENT", 700.0 * math.sin((t - 5) / 10 * math.pi / 2)
+    elif t < 31:
+        state, altitude = "DESCENT", 700.0 - 15.0 * (t - 15)
+    elif t < 76:
+        state, altitude = "ACTIVE", max(460.0 - 10.0 * (t - 31), 0.0)
+    else:
+        state, altitude = "LANDED", 0.0
+
+    pressure = 101325 * (1 - 2.25577e-5 * altitude) ** 5.25588
+    temp = 20 - 0.0065 * altitude
+    voltage = 3.3 - t * 0.0001
+    latitude = 32.2445 + 0.0004 * math.sin(t / 40)
+    longitude = -98.20015 + 0.0004 * math.cos(t / 40)
+    pitch = 5 * math.sin(t * 1.3) + random.uniform(-1, 1)
+    roll = 5 * math.cos(t * 1.1) + random.uniform(-1, 1)
+    spin_rate = 900 + random.uniform(-100, 100) if state == "ACTIVE" else 0
+    heading = (t * 20) % 360
+
+    values = [team_id, int(t * 1000), packet_count, int(altitude * 10), int(pressure), int(temp * 10),
+              int(voltage * 100), 123456 + int(t), int(latitude * 1e5), int(longitude * 1e5),
+              int((altitude + random.uniform(-2, 2)) * 10), random.randint(4, 9), int(pitch * 10), int(roll * 10),
+              int(spin_rate), state, int(heading * 10)]
+    return ",".join(str(value) for value in values)
+
+
+def malform_packet(text):
+    fields = text.split(",")
+    kind = random.randrange(4)
+    if kind == 0:
+        del fields[random.randrange(len(fields))]
+    elif kind == 1:
+        fields[random.randrange(len(fields))] = "#?"
+    elif kind == 2:
+        return ",".join(fields)[:random.randrange(1, len(text))]
+    else:
+        fields.insert(random.randrange(len(fields)), "0")
+    return ",".join(fields)
+
+
+class TelemetrySimulator:
+    """
+    Stands in for the radio on a pseudo-terminal, `port`, streaming synthesised or replayed packets and echoing
+    commands back.
+    """
+
+    def __init__(self, rate=10, replay_file=None, malformed_rate=0, dropout_rate=0, dropout_secs=2, team_id=2594):
+        self.rate = rate
+        self.replay_file = replay_file
+        self.malformed_rate = malformed_rate
+        self.dropout_rate = dropout_rate
+        self.dropout_secs = dropout_secs
+        self.team_id = team_id
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        # Non-blocking so a pty nobody is reading, e.g. the simulator started but the port never opened, can't park
+        # the TX thread in write() where stop() can't reach it
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        self.write_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.sent = 0
+        self.malformed = 0
+        self.dropped = 0
+        self.commands = []
+
+    def start(self):
+        self.threads = [threading.Thread(target=self.run_tx, daemon=True),
+                        threading.Thread(target=self.run_rx, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=1)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def packets(self):
+        if self.replay_file:
+            while True:
+                with open(self.replay_file, "r") as file:
+                    for line in file:
+                        line = line.strip()
+                        if line:
+                            yield line
+        else:
+            start = time.perf_counter()
+            packet_count = 0
+            while True:
+                yield synthesize_packet(self.team_id, packet_count, time.perf_counter() - start)
+                packet_count += 1
+
+    def write(self, text, timeout=0.5):
+        # Returns False if the line was dropped because the pty stayed full for `timeout`. Once part of a line is in,
+        # the rest is always written after it so the reader never gets a torn line.
+        data = (text + "\n").encode("utf-8")
+        with self.write_lock:
+            deadline = time.perf_counter() + timeout
+            started = False
+            while data and not self.stop_event.is_set():
+                _, writable, _ = select.select([], [self.master], [], 0.1)
+                if writable:
+                    try:
+                        written = os.write(self.master, data)
+                    except BlockingIOError:
+                        written = 0
+                    data = data[written:]
+                    started = started or written > 0
+                if not started and time.perf_counter() > deadline:
+                    return False
+            return not data
+
+    def run_tx(self):
+        next_time = time.perf_counter()
+        dropout_until = 0
+        for text in self.packets():
+            if self.stop_event.is_set():
+                break
+
+            now = time.perf_counter()
+            if now < dropout_until:
+                self.dropped += 1
+            elif random.random() < self.dropout_rate:
+                dropout_until = now + self.dropout_secs
+                self.dropped += 1
+            else:
+                if random.random() < self.malformed_rate:
+                    text = malform_packet(text)
+                    self.malformed += 1
+                if self.write(text):
+                    self.sent += 1
+                else:
+                    self.dropped += 1
+
+            # A rate of 0 means saturate the line: write() waits while the pty's buffer is full
+            if self.rate > 0:
+                next_time += 1 / self.rate
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+
+    def run_rx(self):
+        pending = b""
+        while not self.stop_event.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            lines = (pending + os.read(self.master, 4096)).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                command = line.decode("utf-8", "replace").strip()
+                if command:
+                    self.on_command(command)
+
+    def on_command(self, command):
+        self.commands.append(command)
+        if command.startswith("RATE/"):
+            try:
+                self.rate = 1000 / float(command.split("/")[1])
+            except (ValueError, ZeroDivisionError):
+                pass
+        self.write("SIM RX: " + command)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Stream simulated CanSat telemetry into a pseudo-terminal")
+    arg_parser.add_argument("--rate", type=float, default=10, help="packets per second, 0 to saturate the line")
+    arg_parser.add_argument("--replay", default=None, help="raw log to replay instead of synthesising packets")
+    arg_parser.add_argument("--malformed", type=float, default=0, help="fraction of packets to corrupt")
+    arg_parser.add_argument("--dropout", type=float, default=0, help="chance per packet of starting a dropout")
+    arg_parser.add_argument("--dropout-secs", type=float, default=2, help="length of each dropout")
+    args = arg_parser.parse_args()
+
+    simulator = TelemetrySimulator(rate=args.rate, replay_file=args.replay, malformed_rate=args.malformed,
+                                   dropout_rate=args.dropout, dropout_secs=args.dropout_secs)
+    simulator.start()
+    print("Simulating on " + simulator.port)
+    try:
+        while True:
+            time.sleep(5)
+            print(f"sent {simulator.sent}, malformed {simulator.malformed}, dropped {simulator.dropped}, "
+                  f"commands {len(simulator.commands)}")
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import time
+
+import numpy as np
+from PyQt5.QtCore import *
+
+from MinMaxPyramid import MinMaxPyramid
+
+
+class TelemetryStore(QObject):
+    """
+    The most recent `capacity` packets, one double-written ring per field, so view() of the newest n samples is
+    always one contiguous slice. history() keeps a whole channel. GUI thread only.
+    """
+
+    updated = pyqtSignal(object)
+
+    def __init__(self, schema, capacity=1024):
+        super().__init__()
+        self.schema = schema
+        self.capacity = capacity
+
+        self.numeric_fields = [i for i, multiplier in schema.numeric]
+        self.numeric = np.zeros((len(self.numeric_fields), 2 * capacity))
+        self.strings = np.empty((len(schema.strings), 2 * capacity), dtype=object)
+        self.times = np.zeros(2 * capacity)
+
+        # Field name or schema index -> (ring, row)
+        self.rows = {}
+        for row, i in enumerate(self.numeric_fields):
+            self.rows[i] = self.rows[schema.names[i]] = (self.numeric, row)
+        for row, i in enumerate(schema.strings):
+            self.rows[i] = self.rows[schema.names[i]] = (self.strings, row)
+
+        self.total = 0
+        self.histories = {}
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def clear(self):
+        self.total = 0
+        for history in self.histories.values():
+            history.clear()
+
+    def history(self, x_key, y_key):
+        # Shared by every graph of the same pair. One made part way through a session starts from what's in the ring.
+        key = (x_key, y_key)
+        if key not in self.histories:
+            count = len(self)
+            history = MinMaxPyramid(start=self.total - count)
+            history.extend(self.view(x_key, count), self.view(y_key, count))
+            self.histories[key] = history
+        return self.histories[key]
+
+    def append(self, batch):
+        count = len(batch)
+        kept = min(count, self.capacity)
+        positions = (self.total + count - kept + np.arange(kept)) % self.capacity
+        wrapped = positions + self.capacity
+
+        numeric = np.array([batch[i][-kept:] for i in self.numeric_fields])
+        self.numeric[:, positions] = numeric
+        self.numeric[:, wrapped] = numeric
+        if len(self.strings):
+            strings = np.array([batch[i][-kept:] for i in self.schema.strings], dtype=object)
+            self.strings[:, positions] = strings
+            self.strings[:, wrapped] = strings
+        self.times[positions] = batch.times[-kept:]
+        self.times[wrapped] = batch.times[-kept:]
+        for (x_key, y_key), history in self.histories.items():
+            history.extend(batch[x_key], batch[y_key])
+
+        self.total += count
+        self.updated.emit(batch)
+
+    def append_packet(self, packet):
+        # Single packets skip the batch machinery: one column written twice, whatever the capacity
+        position = self.total % self.capacity
+        wrapped = position + self.capacity
+        numeric = self.schema.numeric_getter(packet.values)
+        self.numeric[:, position] = numeric
+        self.numeric[:, wrapped] = numeric
+        for row, i in enumerate(self.schema.strings):
+            self.strings[row, position] = self.strings[row, wrapped] = packet.values[i]
+        self.times[position] = self.times[wrapped] = time.time()
+        for (x_key, y_key), history in self.histories.items():
+            history.extend((packet[x_key],), (packet[y_key],))
+
+        self.total += 1
+
+    def window(self, n, since=0):
+        # How many of the newest samples a reader can see, given it wants at most n and nothing from before `since`
+        return max(min(n, self.total - since, self.capacity), 0)
+
+    def view(self, key, n):
+        # Only good until the next append, so widgets take views when they draw rather than keeping them
+        ring, row = self.rows[key]
+        end = self.total % self.capacity + self.capacity
+        return ring[row, end - n:end]
+
+    def time_view(self, n):
+        end = self.total % self.capacity + self.capacity
+        return self.times[end - n:end]
+
+
+class StoreDisplay:
+    """
+    Mixin for widgets that draw from a TelemetryStore, optionally redrawing through a RedrawScheduler.
+    """
+
+    def init_store(self, schema, store, capacity=1024, scheduler=None, redraw=None):
+        # A display used on its own keeps a private store and fills it itself. Clearing it just hides everything older
+        # than cleared_at.
+        self.owns_store = store is None
+        self.store = store if store is not None else TelemetryStore(schema, capacity=capacity)
+        self.cleared_at = 0
+
+        # With a scheduler new data only marks the widget dirty and it is redrawn at the next frame
+        self.redraw_now = redraw
+        self.scheduler = scheduler
+        if scheduler is not None:
+            scheduler.register(self, redraw)
+
+    def store_packet(self, packet):
+        if self.owns_store:
+            self.store.append_packet(packet)
+
+    def store_batch(self, batch):
+        if self.owns_store:
+            self.store.append(batch)
+
+    def schedule_redraw(self):
+        if self.scheduler is not None:
+            self.scheduler.mark_dirty(self)
+        else:
+            self.redraw_now()
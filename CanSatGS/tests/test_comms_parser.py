@@ -0,0 +1,19 @@
+from CommsParser import PACKET_EXPONENTS, PACKET_NAMES, CommsParser
+
+GOOD = "2277,1000,1,1000,101325,250,500,0,0,0,0,0,0,0,0,ASCENT,0"
+BAD = "2277,1100,2,10x0,101325,250,500,0,0,0,0,0,0,0,0,ASCENT,0"
+
+
+def test_malformed_packet_keeps_raw_text():
+    parser = CommsParser(PACKET_NAMES, PACKET_EXPONENTS)
+    malformed = []
+    warnings = []
+    packets = []
+    parser.malformed.connect(lambda text, reason: malformed.append((text, reason)))
+    parser.warning.connect(warnings.append)
+    parser.packet_batch.connect(packets.extend)
+
+    parser.parse_batch([GOOD, BAD, "12"])
+    assert packets == [GOOD]
+    assert malformed == [(BAD, "field altitude='10x0' is not a number")]
+    assert warnings == ["12"]
@@ -0,0 +1,22 @@
+import pytest
+
+from GSBatch import process_log
+from MissionArchive import MissionArchive
+
+LINES = [f"2277,{100 * i},{i},1000,101325,250,500,0,0,0,0,0,0,0,0,ASCENT,0" for i in range(10)]
+
+
+@pytest.mark.parametrize("output_format", ["csv", "archive"])
+def test_existing_output_needs_force(tmp_path, output_format):
+    log = tmp_path / "flight.txt"
+    log.write_text("\n".join(LINES) + "\n")
+    process_log(str(log), output_format)
+    with pytest.raises(FileExistsError):
+        process_log(str(log), output_format)
+
+    # A forced run replaces the old output instead of adding to it
+    process_log(str(log), output_format, force=True)
+    if output_format == "csv":
+        assert len((tmp_path / "flight.csv").read_text().splitlines()) == len(LINES) + 1
+    else:
+        assert len(MissionArchive(str(tmp_path / "flight.gsa"))) == len(LINES)
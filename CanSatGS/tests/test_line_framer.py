@@ -0,0 +1,41 @@
+from LineFramer import LineFramer
+
+
+def feed_all(framer, chunks):
+    frames = []
+    for chunk in chunks:
+        frames += framer.feed(chunk)
+    return frames + framer.finish()
+
+
+def test_split_reads_give_whole_frames():
+    framer = LineFramer(capacity=64)
+    assert feed_all(framer, [b"AAAA,1,", b"2\r\nBBBB", b",3,4\n\nCC", b"CC,5"]) == ["AAAA,1,2", "BBBB,3,4", "CCCC,5"]
+
+
+def test_overflow_keeps_the_pending_line():
+    # The chunk that finishes the pending line doesn't fit in the space left, which used to throw the line away
+    framer = LineFramer(capacity=32)
+    assert framer.feed(b"AAAA,1,2\nBBBB,3,") == ["AAAA,1,2"]
+    assert feed_all(framer, [b"4\nCCCC,5,6\nDDDD,7,8\nEEEE,9,10\n"]) == ["BBBB,3,4", "CCCC,5,6", "DDDD,7,8",
+                                                                         "EEEE,9,10"]
+    assert framer.dropped == 0
+
+
+def test_large_read_keeps_every_line():
+    framer = LineFramer(capacity=32)
+    lines = [f"PKT,{i},{i * 7}" for i in range(100)]
+    assert feed_all(framer, [("\n".join(lines) + "\n").encode()]) == lines
+
+
+def test_long_line_is_dropped_whole():
+    framer = LineFramer(capacity=32)
+    frames = feed_all(framer, [b"GOOD,1\n" + b"X" * 50, b"X" * 40 + b"XX,tail\nGOOD,2\n", b"GOOD,3"])
+    assert frames == ["GOOD,1", "GOOD,2", "GOOD,3"]
+    assert framer.dropped == 1
+
+
+def test_long_line_in_one_read():
+    framer = LineFramer(capacity=32)
+    assert feed_all(framer, [b"GOOD,1\n" + b"X" * 100 + b"\nGOOD,2\n"]) == ["GOOD,1", "GOOD,2"]
+    assert framer.dropped == 1
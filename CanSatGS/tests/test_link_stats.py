@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+from LinkStats import LinkStats
+
+TEST_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test.txt")
+
+
+def stats_for(sequence, interval=0.25):
+    stats = LinkStats()
+    for i, seq in enumerate(sequence):
+        stats.update(np.array([seq], dtype=np.float64), np.array([i * interval]))
+    return stats
+
+
+def test_gaps_and_late_packets():
+    stats = stats_for([1, 2, 5, 3, 6, 6])
+    assert stats.lost == 1
+    assert stats.gaps == 1
+    assert stats.out_of_order == 1
+    assert stats.duplicates == 1
+    assert stats.resets == 0
+
+
+def test_counter_reset_on_the_pad():
+    # A RESET a minute into a session, long before the sequence window would have caught it
+    stats = stats_for(list(range(240)) + list(range(100)))
+    assert stats.resets == 1
+    assert stats.duplicates == 0
+    assert stats.out_of_order == 0
+    assert stats.lost == 0
+
+
+def test_early_reset_back_to_start():
+    stats = stats_for([0, 1, 2, 3, 0, 1, 2, 3, 4])
+    assert stats.resets == 1
+    assert stats.duplicates == 0
+
+
+def test_test_log_restarts():
+    with open(TEST_LOG) as file:
+        sequence = [float(line.split(",")[2]) for line in file if line.count(",") == 16]
+    stats = stats_for(sequence)
+    assert stats.resets == 3
+    assert stats.duplicates == 0
+    assert stats.out_of_order == 0
+
+
+def test_rate_decays_when_link_goes_quiet():
+    stats = stats_for(range(40), interval=0.25)
+    last = stats.last_time
+    assert abs(stats.packets_per_sec() - 4) < 0.1
+    assert stats.packets_per_sec(last + 2) < stats.packets_per_sec(last)
+    assert stats.packets_per_sec(last + stats.rate_secs + 1) == 0
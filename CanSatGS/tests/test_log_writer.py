@@ -0,0 +1,128 @@
+import threading
+import time
+
+from LogWriter import LogWriter, LogWriterThread
+
+
+class BrokenWriter:
+
+    def write_batch(self, batch):
+        pass
+
+    def poll(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        raise RuntimeError("close failed")
+
+
+class StalledWriter:
+
+    def __init__(self, release):
+        self.release = release
+
+    def write_batch(self, batch):
+        self.release.wait()
+
+    def poll(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_lines_are_written_in_order(tmp_path):
+    path = str(tmp_path / "raw.txt")
+    thread = LogWriterThread(flush_interval=0.01)
+    thread.start()
+    thread.write(path, ["a", "b"], header="header")
+    thread.write(path, ["c"], header="header")
+    thread.stop()
+
+    with open(path) as file:
+        assert file.read() == "header\na\nb\nc\n"
+
+
+def test_close_error_does_not_kill_thread(tmp_path):
+    path = str(tmp_path / "raw.txt")
+    thread = LogWriterThread(flush_interval=0.01)
+    thread.start()
+    thread.write_batch("broken", [], lambda path: BrokenWriter())
+    thread.close_files()
+    thread.write(path, ["after"])
+    thread.close_files()
+    time.sleep(0.1)
+
+    assert thread.is_alive()
+    assert thread.error_count == 1
+    thread.stop()
+    with open(path) as file:
+        assert file.read() == "after\n"
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    release = threading.Event()
+    thread = LogWriterThread(max_queue=2)
+    thread.start()
+    thread.write_batch("stalled", [], lambda path: StalledWriter(release))
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    for i in range(5):
+        thread.write(str(tmp_path / "raw.txt"), ["line"] * 10)
+    assert time.perf_counter() - start < 1
+    assert thread.stats()["dropped_lines"] == 30
+
+    release.set()
+    thread.stop()
+
+
+def test_dead_thread_drops(tmp_path):
+    thread = LogWriterThread()
+    thread.write(str(tmp_path / "raw.txt"), ["line"] * 10)
+    assert thread.stats() == {**thread.stats(), "dropped_lines": 10, "alive": False}
+
+
+def test_errors_are_bounded():
+    thread = LogWriterThread()
+    for i in range(100):
+        thread.add_error(OSError(i))
+    assert thread.error_count == 100
+    assert len(thread.errors) == 16
+
+
+def test_is_empty_only_for_new_files(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = LogWriter(path)
+    assert writer.is_empty
+    writer.write_lines(["1,2"])
+    writer.close()
+
+    writer = LogWriter(path)
+    assert not writer.is_empty
+    writer.close()
+
+
+def test_close_waits_for_room_in_a_full_queue(tmp_path):
+    release = threading.Event()
+    thread = LogWriterThread(max_queue=2)
+    thread.start()
+    thread.write_batch("stalled", [], lambda path: StalledWriter(release))
+    time.sleep(0.05)
+    for i in range(2):
+        thread.write(str(tmp_path / "raw.txt"), ["line"])
+
+    # Times out and says so while the writer is stuck, then gets through once it catches up
+    thread.close_files(timeout=0.05)
+    assert thread.error_count == 1
+    threading.Timer(0.1, release.set).start()
+    thread.close_files(timeout=5)
+    assert thread.error_count == 1
+    thread.stop()
+    assert not thread.writers
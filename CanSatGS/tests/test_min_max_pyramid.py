@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from CommsParser import PACKET_EXPONENTS, PACKET_NAMES, TelemetrySchema
+from MinMaxPyramid import MinMaxPyramid
+
+TEST_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test.txt")
+
+
+def test_levels_keep_spikes():
+    pyramid = MinMaxPyramid(factor=4, capacity=8)
+    y = np.zeros(1000)
+    y[517] = 50.0
+    for i in range(0, 1000, 37):
+        pyramid.extend(np.arange(i, min(i + 37, 1000)), y[i:i + 37])
+
+    assert len(pyramid) == 1000
+    x, low_high = pyramid.points(0, 1000, 10)
+    assert len(x) < 100
+    assert low_high.max() == 50.0
+    assert np.array_equal(pyramid.points(0, 1000, 1000)[1], y)
+
+
+def test_window_in_rising_x():
+    pyramid = MinMaxPyramid()
+    pyramid.extend(np.arange(100) * 0.5, np.zeros(100))
+    assert pyramid.window(10.0, 20.0) == (19, 41)
+    assert pyramid.window(100.0, 200.0) == (0, 0)
+
+
+def test_window_after_resets():
+    # Two runs of mission_time that overlap, then a third that starts again from zero
+    pyramid = MinMaxPyramid()
+    pyramid.extend(np.r_[np.arange(50), np.arange(20, 80)], np.zeros(110))
+    pyramid.extend(np.arange(30), np.zeros(30))
+    assert pyramid.breaks == [50, 110]
+
+    first, last = pyramid.window(60.0, 70.0)
+    assert (first, last) == (89, 101)
+    first, last = pyramid.window(10.0, 12.0)
+    assert pyramid.x[0][first + 1] == 10.0 and last == 123
+
+
+def test_window_on_test_log():
+    schema = TelemetrySchema(PACKET_NAMES, PACKET_EXPONENTS)
+    lines = [line.strip() for line in open(TEST_LOG) if line.count(",") == len(PACKET_NAMES) - 1]
+    batch, rejects = schema.parse_columns(lines)
+    pyramid = MinMaxPyramid()
+    pyramid.extend(batch["mission_time"], batch["altitude"])
+    assert len(pyramid.breaks) == 3
+
+    # Every sample in view must be inside the window, whichever run it came from
+    x = batch["mission_time"]
+    first, last = pyramid.window(20.0, 25.0)
+    inside = np.flatnonzero((x >= 20.0) & (x <= 25.0))
+    assert first <= inside.min() and inside.max() < last
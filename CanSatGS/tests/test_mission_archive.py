@@ -0,0 +1,67 @@
+import pytest
+
+from CommsParser import PACKET_EXPONENTS, PACKET_NAMES, TelemetrySchema
+from LogWriter import LogWriterThread
+from MissionArchive import ArchiveWriter, MissionArchive
+
+SCHEMA = TelemetrySchema(PACKET_NAMES, PACKET_EXPONENTS)
+
+
+def batch(state, count=1, start=0):
+    lines = [f"2277,{100 * (start + i)},{start + i},1000,101325,250,500,0,0,0,0,0,0,0,0,{state},0"
+             for i in range(count)]
+    parsed, rejects = SCHEMA.parse_columns(lines, [float(start + i) for i in range(count)])
+    assert not rejects
+    return parsed
+
+
+def test_round_trip(tmp_path):
+    writer = ArchiveWriter(str(tmp_path / "flight.gsa"), SCHEMA, chunk_rows=2)
+    writer.write_batch(batch("ASCENT", 3))
+    writer.write_batch(batch("DESCENT", 2, start=3))
+    writer.close()
+
+    archive = MissionArchive(str(tmp_path / "flight.gsa"))
+    assert len(archive) == 5
+    assert archive["packet_count"].tolist() == [0, 1, 2, 3, 4]
+    assert archive.to_batch()["software_state"].tolist() == ["ASCENT"] * 3 + ["DESCENT"] * 2
+
+
+def test_non_ascii_state_is_stored(tmp_path):
+    # The framer decodes corrupted radio bytes to U+FFFD
+    writer = ArchiveWriter(str(tmp_path / "flight.gsa"), SCHEMA)
+    writer.write_batch(batch("\ufffdSCENT", 2))
+    writer.write_batch(batch("ASCENT", 2, start=2))
+    writer.close()
+
+    archive = MissionArchive(str(tmp_path / "flight.gsa"))
+    assert len(archive) == 4
+    assert archive.to_batch()["software_state"].tolist() == ["\ufffdSCENT"] * 2 + ["ASCENT"] * 2
+
+
+def test_overlong_state_rejects_only_that_batch(tmp_path):
+    writer = ArchiveWriter(str(tmp_path / "flight.gsa"), SCHEMA)
+    writer.write_batch(batch("ASCENT", 2))
+    with pytest.raises(ValueError):
+        writer.write_batch(batch("PARACHUTE_DEPLOYED_" + "X" * 20, 2, start=2))
+    writer.write_batch(batch("DESCENT", 2, start=4))
+    writer.close()
+
+    archive = MissionArchive(str(tmp_path / "flight.gsa"))
+    assert len(archive) == 4
+    assert archive["packet_count"].tolist() == [0, 1, 4, 5]
+    assert archive.to_batch()["software_state"].tolist() == ["ASCENT"] * 2 + ["DESCENT"] * 2
+
+
+def test_writer_thread_survives_bad_batch(tmp_path):
+    path = str(tmp_path / "flight.gsa")
+    thread = LogWriterThread(flush_interval=0.01)
+    thread.start()
+    thread.write_batch(path, batch("ASCENT", 2), lambda path: ArchiveWriter(path, SCHEMA))
+    thread.write_batch(path, batch("X" * 40, 2, start=2), lambda path: ArchiveWriter(path, SCHEMA))
+    thread.write_batch(path, batch("DESCENT", 2, start=4), lambda path: ArchiveWriter(path, SCHEMA))
+    thread.close_files()
+    thread.stop()
+
+    assert len(thread.errors) == 1
+    assert len(MissionArchive(path)) == 4
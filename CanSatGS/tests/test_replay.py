@@ -0,0 +1,138 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+from PyQt5.QtCore import Qt
+
+from FileComms import FileCommThread, read_lines
+from ReplayIndex import INDEX_SUFFIX, ReplayIndex, packet_values
+
+TEST_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test.txt")
+
+
+def packet(i, state="ASCENT"):
+    return f"2594,{100 * i},{i},{10 * i},101325,250,500,0,0,0,0,0,0,0,0,{state},0"
+
+
+@pytest.fixture
+def log(tmp_path):
+    # A copy, so the index cache is written next to it rather than next to the checked-in log
+    path = str(tmp_path / "flight.txt")
+    shutil.copy(TEST_LOG, path)
+    return path
+
+
+def test_offsets_are_line_starts(tmp_path):
+    path = tmp_path / "flight.txt"
+    lines = [packet(0, "PRELAUNCH"), "CMD TX: ARM", packet(1), "", packet(2), "Hello", packet(3, "DESCENT")]
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode())
+    index = ReplayIndex(str(path))
+
+    assert len(index) == 4
+    for i in range(len(index)):
+        first = next(read_lines(str(path), int(index.offsets[i])))
+        assert packet_values(first)[1] == index.packet_count[i] == i
+    assert index.event_state.tolist() == ["PRELAUNCH", "ASCENT", "DESCENT"]
+
+
+def test_offsets_match_test_log(log):
+    index = ReplayIndex(log)
+    assert len(index) == 8157
+    for i in range(0, len(index), 97):
+        values = packet_values(next(read_lines(log, int(index.offsets[i]))))
+        assert values[0] * 0.001 == pytest.approx(index.mission_time[i])
+        assert values[1] == index.packet_count[i]
+
+
+def test_small_chunks_give_the_same_index(log):
+    index = ReplayIndex(log)
+    offsets = index.offsets.copy()
+    index.build(chunk_size=1000)
+    assert (index.offsets == offsets).all()
+
+
+def test_cache_is_used_until_the_log_changes(log, monkeypatch):
+    index = ReplayIndex(log)
+    assert os.path.exists(log + INDEX_SUFFIX)
+
+    builds = []
+    original = ReplayIndex.build
+    monkeypatch.setattr(ReplayIndex, "build", lambda self, *args, **kwargs: (builds.append(1),
+                                                                            original(self, *args, **kwargs)))
+    assert len(ReplayIndex(log)) == len(index) and not builds
+
+    # Same size, new modification time
+    stat = os.stat(log)
+    os.utime(log, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    ReplayIndex(log)
+    assert len(builds) == 1
+
+    # New size
+    with open(log, "a") as file:
+        file.write(packet(9000) + "\n")
+    assert len(ReplayIndex(log)) == len(index) + 1
+    assert len(builds) == 2
+
+
+def test_window_start(tmp_path):
+    path = tmp_path / "flight.txt"
+    path.write_text("".join(packet(i) + "\n" for i in range(20)))
+    index = ReplayIndex(str(path))
+    assert index.window_start(10, 4) == index.offsets[6]
+    assert index.window_start(2, 600) == 0
+    assert index.window_start(19, 0) == index.offsets[19]
+
+    (tmp_path / "empty.txt").write_text("")
+    assert ReplayIndex(str(tmp_path / "empty.txt")).window_start(0, 600) == 0
+
+
+def test_seek_while_paused_sends_warmup(log):
+    index = ReplayIndex(log)
+    thread = FileCommThread(log, batch_interval=0.016, speed=1)
+    seeks = []
+    warmups = []
+    # Direct, as there's no event loop to deliver across threads
+    thread.signals.seeked.connect(lambda: seeks.append(thread.position), Qt.DirectConnection)
+    thread.signals.warmup_batch.connect(lambda lines, times: warmups.append(lines), Qt.DirectConnection)
+    runner = threading.Thread(target=thread.run)
+    runner.start()
+    try:
+        time.sleep(0.3)
+        thread.set_paused(True)
+        time.sleep(0.1)
+
+        thread.seek(index.window_start(4000, 600), int(index.offsets[4000]), 4000)
+        time.sleep(0.3)
+        assert thread.seek_request is None
+        assert len(seeks) == 1 and len(warmups) == 1
+        assert len(warmups[0]) == 600
+        assert packet_values(warmups[0][-1])[1] == index.packet_count[3999]
+
+        # Still paused at the seek point
+        time.sleep(0.2)
+        assert thread.position == 4000
+    finally:
+        thread.close_port()
+        runner.join(2)
+    assert not runner.is_alive()
+
+
+def test_pause_holds_at_max_speed(log):
+    thread = FileCommThread(log, batch_interval=0.016, speed=0)
+    runner = threading.Thread(target=thread.run)
+    thread.set_paused(True)
+    runner.start()
+    try:
+        time.sleep(0.2)
+        position = thread.position
+        time.sleep(0.2)
+        assert thread.position == position < 8157
+
+        thread.set_paused(False)
+        runner.join(5)
+        assert thread.position == 8157
+    finally:
+        thread.close_port()
+        runner.join(2)
@@ -0,0 +1,55 @@
+import numpy as np
+
+from CommsParser import PACKET_EXPONENTS, PACKET_NAMES, TelemetrySchema
+from TelemetryStore import TelemetryStore
+
+SCHEMA = TelemetrySchema(PACKET_NAMES, PACKET_EXPONENTS)
+
+
+def batch(start, count):
+    lines = [f"2277,{100 * i},{i},{10 * i},101325,250,500,0,0,0,0,0,0,0,0,S{i},0" for i in range(start, start + count)]
+    parsed, rejects = SCHEMA.parse_columns(lines, [float(i) for i in range(start, start + count)])
+    assert not rejects
+    return parsed
+
+
+def test_view_is_newest_samples_after_wrapping():
+    store = TelemetryStore(SCHEMA, capacity=8)
+    for start in range(0, 30, 3):
+        store.append(batch(start, 3))
+
+    assert store.total == 30 and len(store) == 8
+    assert store.view("packet_count", 8).tolist() == list(range(22, 30))
+    assert store.view("software_state", 3).tolist() == ["S27", "S28", "S29"]
+    assert store.time_view(2).tolist() == [28.0, 29.0]
+    # A view is a slice of the ring, not a copy
+    assert store.view("packet_count", 8).base is not None
+
+
+def test_batch_bigger_than_ring_and_single_packets():
+    store = TelemetryStore(SCHEMA, capacity=8)
+    store.append(batch(0, 20))
+    store.append_packet(batch(20, 1).packet(0))
+    assert store.view("altitude", 8).tolist() == [float(i) for i in range(13, 21)]
+
+
+def test_window_respects_clear_point():
+    store = TelemetryStore(SCHEMA, capacity=8)
+    store.append(batch(0, 10))
+    assert store.window(100) == 8
+    assert store.window(100, since=7) == 3
+    assert store.window(100, since=12) == 0
+
+
+def test_history_keeps_the_whole_session():
+    store = TelemetryStore(SCHEMA, capacity=8)
+    store.append(batch(0, 10))
+    # Made part way through, it starts from what the ring still holds
+    history = store.history("mission_time", "packet_count")
+    assert history.start == 2
+    store.append(batch(10, 100))
+    assert len(history) == 108
+    assert np.array_equal(history.low[0][:len(history)], np.arange(2, 110))
+
+    store.clear()
+    assert store.total == 0 and len(history) == 0